@@ -94,6 +94,7 @@ CREATE TABLE exercise_tracking (
     workout_days_per_week  INT,
     experience_level        INT,
     bmi                     NUMERIC(5,2),
+    row_hash                CHAR(32),        -- md5 of the row values and occurrence (the CSV has no id)
     created_at              TIMESTAMP DEFAULT NOW()
 );
 
@@ -109,6 +110,8 @@ CREATE TABLE ml_generated_plans (
 );
 
 -- ====================================================
--- Indexes (optional performance helpers)
+-- Natural keys (the pipeline ETL upserts on these)
 -- ====================================================
-CREATE INDEX idx_exercises_name ON exercise_catalog(exercise);
+CREATE UNIQUE INDEX gym_recommendation_source_id_key ON gym_recommendation(source_id);
+CREATE UNIQUE INDEX exercise_catalog_exercise_key ON exercise_catalog(exercise);
+CREATE UNIQUE INDEX exercise_tracking_row_hash_key ON exercise_tracking(row_hash);
@@ -1,15 +1,51 @@
 # OCR.py
+import multiprocessing
 import os
-from io import BytesIO
-from typing import Union
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 import fitz  # PyMuPDF
-from PIL import Image
 from google.cloud import vision
 from google.oauth2 import service_account
 
+from page_render import (
+    PageEncoding,
+    encode_page,
+    extract_native_text,
+    init_render_worker,
+    open_pdf,
+    render_page_worker,
+)
+
+# Called with (page_index, text) as each page finishes
+PageCallback = Optional[Callable[[int, str], None]]
+# Called with (page_index, info) as each page image is rendered and encoded
+ImageCallback = Optional[Callable[[int, dict], None]]
+
+
 class OCR:
-    def __init__(self):
+    def __init__(self, pipelined: bool = None, render_workers: int = None, max_inflight_requests: int = None,
+                 batch_size: int = None, max_retries: int = None, retry_delay: float = 2.0,
+                 use_text_layer: bool = None, min_text_layer_chars: int = 50,
+                 encoding: PageEncoding = None):
+        """
+        pipelined: render pages in a process pool and stream them into a bounded
+            pool of concurrent Vision requests (default: OCR_PIPELINED env, off).
+        render_workers: render processes (default: OCR_RENDER_WORKERS env, 4).
+        max_inflight_requests: concurrent Vision requests; also bounds how many
+            rendered pages are held in memory (default: OCR_MAX_INFLIGHT env, 8).
+        batch_size: pages per batch_annotate_images call; 1 keeps one
+            document_text_detection RPC per page (default: OCR_BATCH_SIZE env, 1).
+            Vision accepts at most 16 images per synchronous batch.
+        max_retries: retries for failed pages in batch mode (default: OCR_MAX_RETRIES env, 3).
+        use_text_layer: use a page's embedded text (page.get_text()) when it passes
+            a quality heuristic and only rasterize + OCR the remaining pages
+            (default: OCR_USE_TEXT_LAYER env, on).
+        encoding: page image format/quality/grayscale/DPI
+            (default: PageEncoding.from_env(), i.e. RGB PNG at 200 DPI).
+        """
         key_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
         if not key_path or not os.path.exists(key_path):
             raise RuntimeError(
@@ -18,59 +54,246 @@ class OCR:
         credentials = service_account.Credentials.from_service_account_file(key_path)
         self.client = vision.ImageAnnotatorClient(credentials=credentials)
 
-    def _pdf_pages_to_png_bytes_from_path(self, pdf_path: str, dpi: int = 200):
-        png_bytes_list = []
+        if pipelined is None:
+            pipelined = os.getenv("OCR_PIPELINED", "false").lower() == "true"
+        self.pipelined = pipelined
+        self.render_workers = render_workers or int(os.getenv("OCR_RENDER_WORKERS", "4"))
+        self.max_inflight_requests = max_inflight_requests or int(os.getenv("OCR_MAX_INFLIGHT", "8"))
+        self.batch_size = min(16, batch_size or int(os.getenv("OCR_BATCH_SIZE", "1")))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("OCR_MAX_RETRIES", "3"))
+        self.retry_delay = retry_delay
+        if use_text_layer is None:
+            use_text_layer = os.getenv("OCR_USE_TEXT_LAYER", "true").lower() == "true"
+        self.use_text_layer = use_text_layer
+        self.min_text_layer_chars = min_text_layer_chars
+        self.encoding = encoding or PageEncoding.from_env()
+
+    def _pdf_pages_to_image_bytes_from_path(self, pdf_path: str, page_indices: Sequence[int] = None):
         with fitz.open(pdf_path) as doc:
-            for page in doc:
-                pix = page.get_pixmap(dpi=dpi)
-                mode = "RGBA" if pix.alpha else "RGB"
-                img = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
-                if mode == "RGBA":
-                    img = img.convert("RGB")
-                buf = BytesIO()
-                img.save(buf, format="PNG")
-                png_bytes_list.append(buf.getvalue())
-        return png_bytes_list
-
-    def _pdf_pages_to_png_bytes_from_bytes(self, pdf_bytes: bytes, dpi: int = 200):
-        png_bytes_list = []
+            if page_indices is None:
+                page_indices = range(len(doc))
+            return [encode_page(doc[i], self.encoding) for i in page_indices]
+
+    def _pdf_pages_to_image_bytes_from_bytes(self, pdf_bytes: bytes, page_indices: Sequence[int] = None):
         with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
-            for page in doc:
-                pix = page.get_pixmap(dpi=dpi)
-                mode = "RGBA" if pix.alpha else "RGB"
-                img = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
-                if mode == "RGBA":
-                    img = img.convert("RGB")
-                buf = BytesIO()
-                img.save(buf, format="PNG")
-                png_bytes_list.append(buf.getvalue())
-        return png_bytes_list
-
-    def perform_ocr(self, input_data: Union[str, bytes]) -> str:
+            if page_indices is None:
+                page_indices = range(len(doc))
+            return [encode_page(doc[i], self.encoding) for i in page_indices]
+
+    def _iter_page_images_parallel(self, input_data: Union[str, bytes],
+                                   page_indices: Sequence[int]) -> Iterator[Tuple[int, bytes, dict]]:
         """
-        Run OCR on a PDF provided either as a filesystem path (str) or raw bytes.
-        Returns concatenated text.
+        Yield (page_index, image_bytes, info) for ``page_indices`` in order, rendered in a
+        process pool. At most ``max_inflight_requests`` renders are outstanding at once.
         """
+        if not page_indices:
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=self.render_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_render_worker,
+            initargs=(input_data, self.encoding),
+        ) as pool:
+            pending = deque()
+            remaining = iter(page_indices)
+            next_page = next(remaining, None)
+            while next_page is not None or pending:
+                while next_page is not None and len(pending) < self.max_inflight_requests:
+                    pending.append((next_page, pool.submit(render_page_worker, next_page)))
+                    next_page = next(remaining, None)
+                page_index, future = pending.popleft()
+                yield (page_index, *future.result())
+
+    @staticmethod
+    def _text_from_response(response) -> str:
+        if response.full_text_annotation and response.full_text_annotation.text:
+            return response.full_text_annotation.text
+        elif response.text_annotations:
+            return response.text_annotations[0].description
+        return ""
+
+    def _annotate_page(self, content: bytes) -> str:
+        """Run document_text_detection on one page image and return its text."""
+        image = vision.Image(content=content)
+        response = self.client.document_text_detection(image=image)
+
+        if response.error.message:
+            raise RuntimeError(f"Vision API error: {response.error.message}")
+
+        return self._text_from_response(response)
+
+    def _annotate_pages(self, contents: List[bytes]) -> List[str]:
+        """
+        OCR several page images through batch_annotate_images.
+        Errors are isolated per page: only the failed pages are re-sent, with
+        exponential backoff, up to ``max_retries`` times.
+        """
+        if len(contents) == 1 and self.batch_size == 1:
+            return [self._annotate_page(contents[0])]
+
+        feature = vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)
+        texts: List[Union[str, None]] = [None] * len(contents)
+        pending = list(range(len(contents)))
+        errors = {}
+        attempt = 0
+        while pending:
+            requests = [
+                vision.AnnotateImageRequest(image=vision.Image(content=contents[i]), features=[feature])
+                for i in pending
+            ]
+            try:
+                responses = self.client.batch_annotate_images(requests=requests).responses
+            except Exception as e:
+                responses = None
+                errors = {i: str(e) for i in pending}
+
+            if responses is not None:
+                errors = {}
+                for i, response in zip(pending, responses):
+                    if response.error.message:
+                        errors[i] = response.error.message
+                    else:
+                        texts[i] = self._text_from_response(response)
+
+            pending = sorted(errors)
+            if not pending:
+                break
+            attempt += 1
+            if attempt > self.max_retries:
+                details = "; ".join(f"image {i} of batch: {msg}" for i, msg in errors.items())
+                raise RuntimeError(f"Vision API error after {self.max_retries} retries: {details}")
+            time.sleep(self.retry_delay * (2 ** (attempt - 1)))
+
+        return texts
+
+    def _ocr_pages_pipelined(self, input_data: Union[str, bytes], page_indices: Sequence[int],
+                             on_page: PageCallback = None, on_image: ImageCallback = None) -> Dict[int, str]:
+        """
+        Stream rendered pages into a bounded pool of concurrent Vision requests.
+        Peak memory is bounded by the in-flight window, not the page count.
+        """
+        extracted_text = {}
+
+        def collect(future):
+            for page_index, text in zip(in_flight.pop(future), future.result()):
+                extracted_text[page_index] = text
+                if on_page is not None:
+                    on_page(page_index, text)
+
+        with ThreadPoolExecutor(max_workers=self.max_inflight_requests) as ocr_pool:
+            in_flight = {}
+            batch_indices, batch_contents = [], []
+            for page_index, content, info in self._iter_page_images_parallel(input_data, page_indices):
+                if on_image is not None:
+                    on_image(page_index, info)
+                batch_indices.append(page_index)
+                batch_contents.append(content)
+                if len(batch_contents) < self.batch_size:
+                    continue
+                in_flight[ocr_pool.submit(self._annotate_pages, batch_contents)] = batch_indices
+                batch_indices, batch_contents = [], []
+                if len(in_flight) >= self.max_inflight_requests:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+            if batch_contents:
+                in_flight[ocr_pool.submit(self._annotate_pages, batch_contents)] = batch_indices
+            for future in list(in_flight):
+                collect(future)
+
+        return extracted_text
+
+    def _ocr_pages_serial(self, input_data: Union[str, bytes], page_indices: Sequence[int],
+                          on_page: PageCallback = None, on_image: ImageCallback = None) -> Dict[int, str]:
+        if not page_indices:
+            return {}
         if isinstance(input_data, str):
-            page_pngs = self._pdf_pages_to_png_bytes_from_path(input_data)
-        elif isinstance(input_data, (bytes, bytearray, memoryview)):
-            page_pngs = self._pdf_pages_to_png_bytes_from_bytes(bytes(input_data))
+            page_images = self._pdf_pages_to_image_bytes_from_path(input_data, page_indices=page_indices)
         else:
+            page_images = self._pdf_pages_to_image_bytes_from_bytes(input_data, page_indices=page_indices)
+        if on_image is not None:
+            for page_index, (_, info) in zip(page_indices, page_images):
+                on_image(page_index, info)
+
+        extracted_text = {}
+        for i in range(0, len(page_images), self.batch_size):
+            contents = [content for content, _ in page_images[i:i + self.batch_size]]
+            texts = self._annotate_pages(contents)
+            for page_index, text in zip(page_indices[i:i + self.batch_size], texts):
+                extracted_text[page_index] = text
+                if on_page is not None:
+                    on_page(page_index, text)
+        return extracted_text
+
+    def _plan_pages(self, input_data: Union[str, bytes]) -> Tuple[int, Dict[int, str]]:
+        """Return the page count and the usable native text of each page that has one."""
+        native_text = {}
+        with open_pdf(input_data) as doc:
+            page_count = len(doc)
+            if self.use_text_layer:
+                for i, page in enumerate(doc):
+                    text = extract_native_text(page, self.min_text_layer_chars)
+                    if text is not None:
+                        native_text[i] = text
+        return page_count, native_text
+
+    def perform_ocr(self, input_data: Union[str, bytes], stats: Optional[dict] = None,
+                    done_pages: Optional[Dict[int, str]] = None, on_page: PageCallback = None) -> str:
+        """
+        Run OCR on a PDF provided either as a filesystem path (str) or raw bytes.
+        Returns concatenated text.
+        If ``stats`` is given it is filled, as soon as the pages are planned, with
+        how many pages take each path:
+        {"pages", "text_layer_pages", "ocr_pages", "resumed_pages"}; as pages are
+        rendered, "page_images" collects per-page {"page", "bytes", "dpi",
+        "render_seconds", "encode_seconds", ...} and "image_bytes" /
+        "encode_seconds" hold the totals.
+        ``done_pages`` ({page_index: text}) are reused instead of being processed
+        again; ``on_page(page_index, text)`` is called as each other page finishes.
+        """
+        if isinstance(input_data, (bytearray, memoryview)):
+            input_data = bytes(input_data)
+        if not isinstance(input_data, (str, bytes)):
             raise TypeError("perform_ocr expects a file path (str) or PDF bytes.")
+        done_pages = done_pages or {}
 
-        extracted_text = []
-        for content in page_pngs:
-            image = vision.Image(content=content)
-            response = self.client.document_text_detection(image=image)
+        page_count, native_text = self._plan_pages(input_data)
+        ocr_indices = [i for i in range(page_count) if i not in native_text and i not in done_pages]
 
-            if response.error.message:
-                raise RuntimeError(f"Vision API error: {response.error.message}")
+        if stats is not None:
+            stats.update({
+                "pages": page_count,
+                "text_layer_pages": len(native_text),
+                "ocr_pages": len(ocr_indices),
+                "resumed_pages": sum(1 for i in done_pages if i not in native_text),
+                "page_images": [],
+                "image_bytes": 0,
+                "encode_seconds": 0.0,
+            })
 
-            if response.full_text_annotation and response.full_text_annotation.text:
-                extracted_text.append(response.full_text_annotation.text)
-            elif response.text_annotations:
-                extracted_text.append(response.text_annotations[0].description)
-            else:
-                extracted_text.append("")
+        def on_image(page_index: int, info: dict):
+            if stats is not None:
+                stats["page_images"].append({"page": page_index, **info})
+                stats["image_bytes"] += info["bytes"]
+                stats["encode_seconds"] += info["encode_seconds"]
+
+        if on_page is not None:
+            for page_index, text in native_text.items():
+                if page_index not in done_pages:
+                    on_page(page_index, text)
 
-        return "\n\n".join(extracted_text)
\ No newline at end of file
+        if self.pipelined:
+            ocr_text = self._ocr_pages_pipelined(input_data, ocr_indices, on_page, on_image)
+        else:
+            ocr_text = self._ocr_pages_serial(input_data, ocr_indices, on_page, on_image)
+
+        page_texts = []
+        for i in range(page_count):
+            if i in native_text:
+                page_texts.append(native_text[i])
+            elif i in done_pages:
+                page_texts.append(done_pages[i])
+            else:
+                page_texts.append(ocr_text[i])
+        return "\n\n".join(page_texts)
@@ -1,35 +1,52 @@
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, HTTPException
 from fastapi.responses import JSONResponse
-import run_ocr_main
-import traceback
+import jobs
 
 app = FastAPI()
+job_manager = jobs.JobManager()
 
 @app.get("/health")
 def health_check():
     return {"status": "ok", "service": "ocr_engine"}
 
-@app.post("/perform-ocr")
-def perform_ocr(full_process: bool = False):
+@app.post("/perform-ocr", status_code=202)
+def perform_ocr(full_process: bool = False, force: bool = False, prefix: str = "raw-literature"):
     """
-    Trigger OCR processing.
-    - If full_process=True → process all PDFs in raw-literature.
+    Trigger OCR processing as a background job and return its id immediately.
+    - If full_process=True → process all PDFs under prefix whose source
+      changed since their last successful OCR (all of them with force=True).
     - Otherwise → process only unprocessed PDFs.
+    Only one job per (overlapping) input prefix runs at a time.
+    Poll GET /jobs/{job_id} for progress.
     """
     try:
-        # Run OCR synchronously
-        run_ocr_main.run_ocr(full_process)
+        job = job_manager.submit(prefix, full_process=full_process, force=force)
+    except jobs.JobConflictError as e:
+        return JSONResponse(
+            status_code=409,
+            content={"status": "conflict", "message": str(e), "job_id": e.job_id}
+        )
+    return {
+        "status": "started",
+        "message": "OCR job running in background",
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+    }
 
-        # run_ocr_main() itself handles logging and will print
-        # "No more new files requiring OCR. OCR completed."
-        # if there are no new files to process.
-        return {"status": "completed", "message": "OCR process finished."}
+@app.get("/jobs")
+def list_jobs():
+    """List known OCR jobs (most recent last) with their progress summary."""
+    return {
+        "jobs": [
+            {k: v for k, v in job.to_dict().items() if k not in ("files", "skipped")}
+            for job in job_manager.list()
+        ]
+    }
 
-    except Exception as e:
-        # Log full traceback to container logs for debugging
-        print("OCR execution failed:")
-        print(traceback.format_exc())
-        return JSONResponse(
-            status_code=500,
-            content={"status": "error", "message": str(e)}
-        )
\ No newline at end of file
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Per-file and per-page progress, throughput (pages/sec) and errors of an OCR job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"OCR job '{job_id}' not found")
+    return job.to_dict()
@@ -0,0 +1,188 @@
+# jobs.py
+# Background OCR jobs: POST /perform-ocr submits a job and returns its id,
+# GET /jobs/{id} reports per-file / per-page progress, throughput and errors.
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import run_ocr_main
+
+JOB_WORKERS = int(os.getenv("OCR_JOB_WORKERS", "2"))
+JOB_HISTORY = int(os.getenv("OCR_JOB_HISTORY", "100"))
+
+
+class JobConflictError(Exception):
+    """Raised when a job for an overlapping input prefix is already queued or running."""
+
+    def __init__(self, job_id: str, prefix: str):
+        super().__init__(f"OCR job {job_id} is already running for prefix '{prefix}'")
+        self.job_id = job_id
+        self.prefix = prefix
+
+
+def _normalize_prefix(prefix: str) -> str:
+    return prefix.strip("/")
+
+
+def _prefixes_overlap(a: str, b: str) -> bool:
+    # list_blobs prefixes are plain string prefixes: "raw-lit" lists raw-literature/, "" lists everything
+    return a.startswith(b) or b.startswith(a)
+
+
+class OCRJob(run_ocr_main.OCRProgress):
+    """One OCR run; records run_ocr progress hooks under a lock."""
+
+    def __init__(self, prefix: str, full_process: bool, force: bool):
+        self.id = uuid.uuid4().hex
+        self.prefix = prefix
+        self.full_process = full_process
+        self.force = force
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.skipped: List[str] = []
+        self.files: Dict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ---- OCRProgress hooks ----
+    def files_planned(self, names, skipped):
+        with self._lock:
+            self.skipped = list(skipped)
+            for name in names:
+                self.files[name] = {"status": "pending", "pages_done": 0, "stats": None, "error": None,
+                                    "started_at": None, "finished_at": None}
+
+    def file_started(self, name, stats):
+        with self._lock:
+            entry = self.files[name]
+            entry["status"] = "running"
+            entry["stats"] = stats  # filled live by OCR.perform_ocr
+            entry["started_at"] = time.time()
+
+    def page_done(self, name, page_index):
+        with self._lock:
+            self.files[name]["pages_done"] += 1
+
+    def file_finished(self, name, stats):
+        with self._lock:
+            entry = self.files[name]
+            entry["status"] = "completed"
+            entry["finished_at"] = time.time()
+
+    def file_failed(self, name, error):
+        with self._lock:
+            entry = self.files[name]
+            entry["status"] = "failed"
+            entry["error"] = error
+            entry["finished_at"] = time.time()
+
+    # ---- reporting ----
+    def to_dict(self) -> dict:
+        with self._lock:
+            now = time.time()
+            files = []
+            pages_done = pages_total = 0
+            for name, entry in self.files.items():
+                stats = dict(entry["stats"] or {})
+                total = stats.get("pages")
+                # resumed pages were done by an earlier run
+                done = entry["pages_done"] + stats.get("resumed_pages", 0)
+                pages_done += entry["pages_done"]
+                pages_total += total or 0
+                files.append({
+                    "name": name,
+                    "status": entry["status"],
+                    "pages_total": total,
+                    "pages_done": done,
+                    "text_layer_pages": stats.get("text_layer_pages"),
+                    "ocr_pages": stats.get("ocr_pages"),
+                    "resumed_pages": stats.get("resumed_pages"),
+                    "error": entry["error"],
+                })
+            elapsed = None
+            if self.started_at is not None:
+                elapsed = (self.finished_at or now) - self.started_at
+            counts = {s: 0 for s in ("pending", "running", "completed", "failed")}
+            for f in files:
+                counts[f["status"]] += 1
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "prefix": self.prefix,
+                "full_process": self.full_process,
+                "force": self.force,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "elapsed_seconds": elapsed,
+                "progress": {
+                    "files_total": len(files),
+                    "files_skipped": len(self.skipped),
+                    **{f"files_{k}": v for k, v in counts.items()},
+                    "pages_total": pages_total,
+                    "pages_done": pages_done,
+                    "pages_per_second": pages_done / elapsed if elapsed else None,
+                },
+                "files": files,
+                "skipped": self.skipped,
+                "error": self.error,
+            }
+
+
+class JobManager:
+    def __init__(self, max_workers: int = JOB_WORKERS, history: int = JOB_HISTORY):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ocr-job")
+        self._jobs: "OrderedDict[str, OCRJob]" = OrderedDict()
+        self._active: Dict[str, str] = {}  # prefix -> job id
+        self._history = history
+        self._lock = threading.Lock()
+
+    def submit(self, prefix: str = "raw-literature", full_process: bool = False, force: bool = False) -> OCRJob:
+        prefix = _normalize_prefix(prefix)
+        with self._lock:
+            for active_prefix, job_id in self._active.items():
+                if _prefixes_overlap(prefix, active_prefix):
+                    raise JobConflictError(job_id, active_prefix)
+            job = OCRJob(prefix, full_process, force)
+            self._jobs[job.id] = job
+            self._active[prefix] = job.id
+            self._trim()
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: OCRJob):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            run_ocr_main.run_ocr(job.full_process, force=job.force, raw_folder=job.prefix, progress=job)
+            job.status = "completed"
+        except Exception as e:
+            print(f"OCR job {job.id} failed:")
+            print(traceback.format_exc())
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._active.pop(job.prefix, None)
+
+    def _trim(self):
+        """Drop the oldest finished jobs beyond the history limit."""
+        finished = [jid for jid, j in self._jobs.items() if j.status in ("completed", "failed")]
+        for jid in finished[:max(0, len(self._jobs) - self._history)]:
+            del self._jobs[jid]
+
+    def get(self, job_id: str) -> Optional[OCRJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[OCRJob]:
+        with self._lock:
+            return list(self._jobs.values())
@@ -0,0 +1,108 @@
+# local_gcs.py
+# Minimal stand-in for google.cloud.storage.Bucket backed by a local directory,
+# so the OCR runner and its manifest can run offline (OCR_LOCAL_BUCKET_DIR).
+# Only the calls used by run_ocr_main / ocr_manifest are implemented.
+import base64
+import hashlib
+import os
+import threading
+from typing import Iterator, Optional
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+# if_generation_match checks and the writes they guard are atomic within one process
+_generation_lock = threading.Lock()
+
+
+class LocalBlob:
+    def __init__(self, bucket: "LocalBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+        self.generation: Optional[int] = None
+        self.md5_hash: Optional[str] = None
+        self.size: Optional[int] = None
+
+    @property
+    def _path(self) -> str:
+        return os.path.join(self.bucket.root, self.name)
+
+    def reload(self):
+        stat = os.stat(self._path)
+        with open(self._path, "rb") as f:
+            data = f.read()
+        # GCS generations change on every write; mtime_ns is the local analogue
+        self.generation = stat.st_mtime_ns
+        self.md5_hash = base64.b64encode(hashlib.md5(data).digest()).decode()
+        self.size = stat.st_size
+        return self
+
+    def exists(self) -> bool:
+        return os.path.isfile(self._path)
+
+    def _current_generation(self) -> int:
+        """Generation on disk now, 0 if the file does not exist (GCS convention)."""
+        try:
+            return os.stat(self._path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _check_generation(self, if_generation_match: Optional[int]):
+        if if_generation_match is not None and self._current_generation() != if_generation_match:
+            raise PreconditionFailed(f"{self.name}: generation does not match {if_generation_match}")
+
+    def download_as_bytes(self, if_generation_match: Optional[int] = None) -> bytes:
+        with _generation_lock:
+            self._check_generation(if_generation_match)
+            try:
+                with open(self._path, "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                raise NotFound(self.name)
+
+    def download_as_text(self, encoding: str = "utf-8", if_generation_match: Optional[int] = None) -> str:
+        return self.download_as_bytes(if_generation_match=if_generation_match).decode(encoding)
+
+    def upload_from_string(self, data, content_type: str = None, if_generation_match: Optional[int] = None):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        tmp_path = f"{self._path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with _generation_lock:
+            try:
+                self._check_generation(if_generation_match)
+            except PreconditionFailed:
+                os.remove(tmp_path)
+                raise
+            os.replace(tmp_path, self._path)
+            # bump the mtime so back-to-back writes still get distinct generations
+            generation = self._current_generation()
+            if if_generation_match is not None and generation <= if_generation_match:
+                os.utime(self._path, ns=(if_generation_match + 1, if_generation_match + 1))
+        self.reload()
+
+
+class LocalBucket:
+    def __init__(self, root: str):
+        self.root = root
+        self.name = os.path.basename(os.path.abspath(root))
+
+    def blob(self, name: str) -> LocalBlob:
+        return LocalBlob(self, name)
+
+    def get_blob(self, name: str) -> Optional[LocalBlob]:
+        blob = LocalBlob(self, name)
+        try:
+            return blob.reload()
+        except FileNotFoundError:
+            return None
+
+    def list_blobs(self, prefix: str = "") -> Iterator[LocalBlob]:
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in sorted(filenames):
+                if filename.endswith(".tmp"):
+                    continue
+                name = os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    yield LocalBlob(self, name).reload()
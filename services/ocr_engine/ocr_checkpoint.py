@@ -0,0 +1,80 @@
+# ocr_checkpoint.py
+# Local persistence for the OCR runner: per-page partial results of the file
+# in flight, so an interrupted file resumes at the last finished page.
+# (Which files need OCR at all is tracked by ocr_manifest.OCRManifest.)
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+
+class PageCheckpoint:
+    """
+    Append-only JSON-lines file: a header with the source blob's identity,
+    then one {"page", "text"} line per finished page. A checkpoint whose
+    header does not match the current generation/md5 is discarded.
+    """
+
+    def __init__(self, directory: str, blob_name: str, generation, md5: Optional[str]):
+        os.makedirs(directory, exist_ok=True)
+        name = hashlib.sha256(blob_name.encode()).hexdigest()[:16]
+        self.path = os.path.join(directory, f"{name}.jsonl")
+        self.header = {"blob": blob_name, "generation": generation, "md5": md5}
+        self._lock = threading.Lock()
+        self._file = None
+        self._valid_bytes = 0  # end of the last complete line seen by load()
+
+    def load(self) -> Dict[int, str]:
+        """Return {page_index: text} of pages finished by a previous run of the same source."""
+        self._valid_bytes = 0
+        if not os.path.exists(self.path):
+            return {}
+        pages = {}
+        with open(self.path, "rb") as f:
+            header_line = f.readline()
+            try:
+                header = json.loads(header_line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                return {}
+            if header != self.header or not header_line.endswith(b"\n"):
+                return {}
+            offset = len(header_line)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partially written last line
+                try:
+                    entry = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    break
+                pages[entry["page"]] = entry["text"]
+                offset += len(line)
+        self._valid_bytes = offset
+        return pages
+
+    def open(self, resumed_pages: Dict[int, str]):
+        """Start writing; keeps already finished pages, resets a stale checkpoint."""
+        if resumed_pages:
+            # drop a torn last line so the next record starts on a line of its own
+            os.truncate(self.path, self._valid_bytes)
+            self._file = open(self.path, "a", encoding="utf-8")
+        else:
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._file.write(json.dumps(self.header) + "\n")
+            self._file.flush()
+
+    def record(self, page_index: int, text: str):
+        with self._lock:
+            self._file.write(json.dumps({"page": page_index, "text": text}) + "\n")
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def clear(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
@@ -0,0 +1,107 @@
+# ocr_manifest.py
+# Persistent record of every raw PDF's OCR: source generation/md5, output
+# path and status. Stored as one JSON object in the bucket (or a LocalBucket),
+# so discovering unprocessed PDFs needs only the raw listing.
+#
+# Several runs can share the manifest (concurrent OCR jobs on different
+# prefixes, or the CLI next to the API), so a save never uploads this
+# instance's whole view: it re-reads the stored manifest, applies only the
+# entries this instance changed and uploads with if_generation_match,
+# retrying when another writer got there first.
+import json
+import threading
+import time
+from typing import Dict, Optional, Set
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+
+class OCRManifest:
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    SAVE_RETRIES = 10
+
+    def __init__(self, bucket, blob_name: str = "manifests/ocr_manifest.json"):
+        self.bucket = bucket
+        self.blob_name = blob_name
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        self._dirty: Set[str] = set()  # entries changed since the last save
+        self.exists = False
+        self.load()
+
+    def _read(self):
+        """(entries, generation) of the stored manifest; generation 0 if there is none yet."""
+        blob = self.bucket.get_blob(self.blob_name)
+        if blob is None:
+            return {}, 0
+        return json.loads(blob.download_as_text(if_generation_match=blob.generation)), blob.generation
+
+    def load(self):
+        for _ in range(self.SAVE_RETRIES):
+            try:
+                entries, generation = self._read()
+                break
+            except (NotFound, PreconditionFailed):
+                continue  # replaced between metadata and download
+        else:
+            raise RuntimeError(f"Could not read OCR manifest {self.blob_name}")
+        with self._lock:
+            self.exists = generation != 0
+            self._entries = entries
+            self._dirty.clear()
+
+    def _save(self):
+        if not self._dirty and self.exists:
+            return
+        for _ in range(self.SAVE_RETRIES):
+            try:
+                entries, generation = self._read()
+                entries.update({name: self._entries[name] for name in self._dirty})
+                self.bucket.blob(self.blob_name).upload_from_string(
+                    json.dumps(entries), content_type="application/json", if_generation_match=generation)
+            except (NotFound, PreconditionFailed):
+                continue  # another writer saved first; merge again on top of its version
+            self._entries = entries
+            self._dirty.clear()
+            self.exists = True
+            return
+        raise RuntimeError(f"Could not save OCR manifest {self.blob_name}: too many concurrent updates")
+
+    def get(self, source_name: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(source_name)
+            return dict(entry) if entry is not None else None
+
+    def is_current(self, source_name: str, generation, md5: Optional[str]) -> bool:
+        """True if the source was OCR'd successfully at this generation/md5."""
+        entry = self.get(source_name)
+        return (entry is not None
+                and entry["status"] == self.STATUS_DONE
+                and entry["generation"] == generation
+                and entry["md5"] == md5)
+
+    def _record(self, source_name: str, generation, md5: Optional[str], status: str,
+                output: Optional[str] = None, error: Optional[str] = None, save: bool = True):
+        with self._lock:
+            self._entries[source_name] = {
+                "generation": generation,
+                "md5": md5,
+                "status": status,
+                "output": output,
+                "error": error,
+                "updated_at": time.time(),
+            }
+            self._dirty.add(source_name)
+            if save:
+                self._save()
+
+    def mark_done(self, source_name: str, generation, md5: Optional[str], output: str, save: bool = True):
+        self._record(source_name, generation, md5, self.STATUS_DONE, output=output, save=save)
+
+    def mark_failed(self, source_name: str, generation, md5: Optional[str], error: str):
+        self._record(source_name, generation, md5, self.STATUS_FAILED, error=error)
+
+    def save(self):
+        with self._lock:
+            self._save()
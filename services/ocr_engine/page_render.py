@@ -0,0 +1,150 @@
+# page_render.py
+# PDF page rendering helpers. Kept free of GCP imports so render worker
+# processes (spawned by OCR's pipelined mode) start quickly.
+import os
+import time
+from io import BytesIO
+from typing import Tuple, Union
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+
+class PageEncoding:
+    """
+    How pages are rasterized and encoded for Vision.
+    fmt: "png" (lossless), "jpeg" or "webp" (lossy, ``quality`` 1-100).
+    grayscale: render a single-channel pixmap instead of RGB.
+    dpi / max_side_px: render at ``dpi``, lowered for large pages so the long
+        side stays within ``max_side_px`` pixels (never below ``min_dpi``).
+    PNG and JPEG are encoded directly from the fitz pixmap; only WebP goes
+    through PIL.
+    """
+
+    FORMATS = ("png", "jpeg", "webp")
+
+    def __init__(self, fmt: str = "png", quality: int = 85, grayscale: bool = False,
+                 dpi: int = 200, max_side_px: int = 0, min_dpi: int = 72):
+        fmt = fmt.lower()
+        if fmt == "jpg":
+            fmt = "jpeg"
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unsupported page image format '{fmt}', expected one of {self.FORMATS}")
+        self.fmt = fmt
+        self.quality = quality
+        self.grayscale = grayscale
+        self.dpi = dpi
+        self.max_side_px = max_side_px
+        self.min_dpi = min_dpi
+
+    @classmethod
+    def from_env(cls) -> "PageEncoding":
+        return cls(
+            fmt=os.getenv("OCR_IMAGE_FORMAT", "png"),
+            quality=int(os.getenv("OCR_IMAGE_QUALITY", "85")),
+            grayscale=os.getenv("OCR_GRAYSCALE", "false").lower() == "true",
+            dpi=int(os.getenv("OCR_DPI", "200")),
+            max_side_px=int(os.getenv("OCR_MAX_IMAGE_SIDE", "0")),
+        )
+
+    def dpi_for(self, page) -> int:
+        if not self.max_side_px:
+            return self.dpi
+        long_side_pt = max(page.rect.width, page.rect.height)
+        if not long_side_pt:
+            return self.dpi
+        return max(self.min_dpi, min(self.dpi, int(self.max_side_px * 72 / long_side_pt)))
+
+
+def encode_page(page, encoding: PageEncoding) -> Tuple[bytes, dict]:
+    """Rasterize and encode one page; returns (image bytes, size/timing info)."""
+    start = time.perf_counter()
+    dpi = encoding.dpi_for(page)
+    colorspace = fitz.csGRAY if encoding.grayscale else fitz.csRGB
+    pix = page.get_pixmap(dpi=dpi, colorspace=colorspace, alpha=False)
+    rendered = time.perf_counter()
+
+    if encoding.fmt == "png":
+        data = pix.tobytes("png")
+    elif encoding.fmt == "jpeg":
+        data = pix.tobytes("jpg", jpg_quality=encoding.quality)
+    else:
+        mode = "L" if pix.n == 1 else "RGB"
+        img = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+        buf = BytesIO()
+        img.save(buf, format="WEBP", quality=encoding.quality)
+        data = buf.getvalue()
+    done = time.perf_counter()
+
+    return data, {
+        "format": encoding.fmt,
+        "dpi": dpi,
+        "width": pix.width,
+        "height": pix.height,
+        "bytes": len(data),
+        "render_seconds": rendered - start,
+        "encode_seconds": done - rendered,
+    }
+
+
+def open_pdf(input_data: Union[str, bytes]):
+    if isinstance(input_data, str):
+        return fitz.open(input_data)
+    return fitz.open(stream=input_data, filetype="pdf")
+
+
+# ----------------------------
+# Render worker (process pool)
+# ----------------------------
+_render_doc = None
+_render_encoding = PageEncoding()
+
+
+def init_render_worker(input_data: Union[str, bytes], encoding: PageEncoding):
+    """Open the PDF once per worker process; fitz documents are not picklable."""
+    global _render_doc, _render_encoding
+    _render_doc = open_pdf(input_data)
+    _render_encoding = encoding
+
+
+def render_page_worker(page_index: int) -> Tuple[bytes, dict]:
+    return encode_page(_render_doc[page_index], _render_encoding)
+
+
+# ----------------------------
+# Native text layer
+# ----------------------------
+def native_text_is_usable(text: str, min_chars: int = 50) -> bool:
+    """
+    Heuristic for whether a page's embedded text layer can replace OCR:
+    enough characters, mostly alphanumeric, and no encoding garbage.
+    """
+    stripped = "".join(text.split())
+    if len(stripped) < min_chars:
+        return False
+    if stripped.count("\ufffd") > 0.01 * len(stripped):
+        return False
+    alnum = sum(c.isalnum() for c in stripped)
+    return alnum >= 0.5 * len(stripped)
+
+
+def _image_coverage(page) -> float:
+    page_area = abs(page.rect)
+    if not page_area:
+        return 0.0
+    covered = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    return min(1.0, covered / page_area)
+
+
+def extract_native_text(page, min_chars: int = 50):
+    """
+    Return the page's text layer if it is usable, else None (page needs OCR).
+    Pages dominated by images (scans, figures) with only a little text still go
+    to OCR so the text inside the images is not lost.
+    """
+    text = page.get_text()
+    if not native_text_is_usable(text, min_chars):
+        return None
+    if len(text) < 10 * min_chars and _image_coverage(page) > 0.5:
+        return None
+    return text
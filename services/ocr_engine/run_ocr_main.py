@@ -1,6 +1,8 @@
 # run_ocr_main.py
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
 from google.cloud import storage
@@ -9,6 +11,9 @@ from google.oauth2 import service_account
 # Make OCR importable
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from OCR import OCR  # noqa: E402
+from local_gcs import LocalBucket  # noqa: E402
+from ocr_checkpoint import PageCheckpoint  # noqa: E402
+from ocr_manifest import OCRManifest  # noqa: E402
 
 # ----------------------------
 # GCS configuration
@@ -16,35 +21,82 @@ from OCR import OCR  # noqa: E402
 PROJECT_ID = "rich-access-471117-r0"
 BUCKET_NAME = "fitai-data-bucket"
 KEY_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+# Serve the bucket from a local directory instead (offline runs / testing)
+LOCAL_BUCKET_DIR = os.getenv("OCR_LOCAL_BUCKET_DIR")
 
-credentials = service_account.Credentials.from_service_account_file(KEY_PATH)
-storage_client = storage.Client(project=PROJECT_ID, credentials=credentials)
-bucket = storage_client.bucket(BUCKET_NAME)
+if LOCAL_BUCKET_DIR:
+    bucket = LocalBucket(LOCAL_BUCKET_DIR)
+else:
+    credentials = service_account.Credentials.from_service_account_file(KEY_PATH)
+    storage_client = storage.Client(project=PROJECT_ID, credentials=credentials)
+    bucket = storage_client.bucket(BUCKET_NAME)
+
+# ----------------------------
+# Runner configuration
+# ----------------------------
+FILE_CONCURRENCY = int(os.getenv("OCR_FILE_CONCURRENCY", "2"))
+CHECKPOINT_DIR = os.getenv("OCR_CHECKPOINT_DIR", "tmp/ocr_checkpoints")
+# Manifest of every PDF's last OCR; a blob in the bucket unless
+# OCR_MANIFEST_PATH puts it on local disk
+MANIFEST_BLOB = os.getenv("OCR_MANIFEST_BLOB", "manifests/ocr_manifest.json")
+MANIFEST_PATH = os.getenv("OCR_MANIFEST_PATH")
 
 # ----------------------------
 # Helpers
 # ----------------------------
-def list_unprocessed_files(raw_folder: str = "raw-literature",
-                           processed_folder: str = "processed-literature") -> List[str]:
+def output_blob_name(source_name: str, processed_folder: str = "processed-literature") -> str:
+    base = os.path.splitext(os.path.basename(source_name))[0]
+    return f"{processed_folder}/{base}.txt"
+
+def load_manifest(raw_folder: str = "raw-literature",
+                  processed_folder: str = "processed-literature") -> OCRManifest:
     """
-    Return basenames of PDFs in raw_folder that do NOT have a corresponding .txt in processed_folder.
+    Load the OCR manifest. PDFs under raw_folder that the manifest does not
+    know yet (first run, or a prefix no earlier run covered) but that already
+    have a .txt in processed_folder are recorded as done at their current
+    generation, so they are not re-OCR'd.
     """
-    raw_blobs = bucket.list_blobs(prefix=raw_folder)
-    processed_blobs = bucket.list_blobs(prefix=processed_folder)
+    if MANIFEST_PATH:
+        manifest = OCRManifest(LocalBucket(os.path.dirname(MANIFEST_PATH) or "."),
+                               os.path.basename(MANIFEST_PATH))
+    else:
+        manifest = OCRManifest(bucket, MANIFEST_BLOB)
+    unknown = [b for b in list_raw_pdf_blobs(raw_folder) if manifest.get(b.name) is None]
+    if not unknown:
+        return manifest
 
     processed_basenames = {
         os.path.splitext(os.path.basename(b.name))[0].lower()
-        for b in processed_blobs
+        for b in bucket.list_blobs(prefix=processed_folder)
         if b.name.lower().endswith(".txt")
     }
+    seeded = 0
+    for b in unknown:
+        if os.path.splitext(os.path.basename(b.name))[0].lower() in processed_basenames:
+            manifest.mark_done(b.name, b.generation, b.md5_hash,
+                               output_blob_name(b.name, processed_folder), save=False)
+            seeded += 1
+    if seeded or not manifest.exists:
+        manifest.save()
+        print(f"Seeded OCR manifest with {seeded} PDF(s) under {raw_folder}/ "
+              f"from existing outputs under {processed_folder}/")
+    return manifest
+
+def find_unprocessed_blobs(raw_folder: str = "raw-literature", manifest: OCRManifest = None) -> list:
+    """
+    Return the raw PDF blobs that need OCR: never processed, failed last time,
+    or modified (new generation/md5) since their last successful OCR.
+    Only raw_folder is listed; everything else comes from the manifest.
+    """
+    manifest = manifest or load_manifest(raw_folder)
+    return [b for b in list_raw_pdf_blobs(raw_folder)
+            if not manifest.is_current(b.name, b.generation, b.md5_hash)]
 
-    unprocessed = [
-        os.path.basename(b.name)
-        for b in raw_blobs
-        if b.name.lower().endswith(".pdf")
-        and os.path.splitext(os.path.basename(b.name))[0].lower() not in processed_basenames
-    ]
-    return unprocessed
+def list_unprocessed_files(raw_folder: str = "raw-literature") -> List[str]:
+    """
+    Return basenames of PDFs in raw_folder that need OCR (see find_unprocessed_blobs).
+    """
+    return [os.path.basename(b.name) for b in find_unprocessed_blobs(raw_folder)]
 
 def upload_text_to_gcs(text: str, destination_blob_name: str):
     blob = bucket.blob(destination_blob_name)
@@ -52,44 +104,124 @@ def upload_text_to_gcs(text: str, destination_blob_name: str):
     blob.upload_from_string(text, content_type="text/plain; charset=utf-8")
     print(f"Uploaded text → gs://{BUCKET_NAME}/{destination_blob_name}")
 
+class OCRProgress:
+    """No-op progress hooks for run_ocr; the job API (jobs.py) records them."""
+
+    def files_planned(self, names: List[str], skipped: List[str]):
+        pass
+
+    def file_started(self, name: str, stats: dict):
+        """``stats`` is filled by OCR.perform_ocr as soon as the pages are planned."""
+        pass
+
+    def page_done(self, name: str, page_index: int):
+        pass
+
+    def file_finished(self, name: str, stats: dict):
+        pass
+
+    def file_failed(self, name: str, error: str):
+        pass
+
+def list_raw_pdf_blobs(raw_folder: str = "raw-literature"):
+    return [b for b in bucket.list_blobs(prefix=raw_folder) if b.name.lower().endswith(".pdf")]
+
+def ocr_blob(ocr: OCR, blob, progress: OCRProgress = None) -> dict:
+    """
+    OCR one raw PDF blob and upload its text, checkpointing each finished page
+    so that an interrupted run resumes at the last finished page.
+    """
+    dest = output_blob_name(blob.name)
+    checkpoint = PageCheckpoint(CHECKPOINT_DIR, blob.name, blob.generation, blob.md5_hash)
+    done_pages = checkpoint.load()
+    if done_pages:
+        print(f"Resuming {blob.name}: {len(done_pages)} page(s) already done")
+    else:
+        print(f"Processing {blob.name} (streaming) ...")
+
+    progress = progress or OCRProgress()
+    start = time.perf_counter()
+    pdf_bytes = blob.download_as_bytes()   # <- in memory
+    stats = {}
+    progress.file_started(blob.name, stats)
+
+    def on_page(page_index: int, text: str):
+        checkpoint.record(page_index, text)
+        progress.page_done(blob.name, page_index)
+
+    checkpoint.open(done_pages)
+    try:
+        text = ocr.perform_ocr(pdf_bytes, stats=stats, done_pages=done_pages,
+                               on_page=on_page)   # <- in memory
+    finally:
+        checkpoint.close()
+    print(f"  {blob.name}: {stats['pages']} page(s): {stats['text_layer_pages']} from text layer, "
+          f"{stats['ocr_pages']} via Vision OCR, {stats['resumed_pages']} resumed from checkpoint")
+    upload_text_to_gcs(text, dest)
+    checkpoint.clear()
+    stats["output"] = dest
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
 # ----------------------------
 # Main OCR Runner (streaming)
 # ----------------------------
-def run_ocr(full_folder_process: bool = False):
+def run_ocr(full_folder_process: bool = False, force: bool = False, max_workers: int = None,
+            raw_folder: str = "raw-literature", progress: OCRProgress = None) -> dict:
     """
     - If full_folder_process:
-        OCR every PDF under raw-literature/ (streams bytes; no local disk writes).
+        OCR every PDF under raw-literature/ (streams bytes; no local disk writes),
+        skipping PDFs whose generation/md5 is unchanged since their last
+        successful OCR unless force=True.
       Else:
-        Only OCR PDFs that don't yet have a corresponding .txt under processed-literature/.
+        Only OCR PDFs that are new, failed last time or changed since their
+        last successful OCR, according to the OCR manifest.
+    Up to max_workers (default OCR_FILE_CONCURRENCY) PDFs are processed at once.
+    Per-page progress is checkpointed under OCR_CHECKPOINT_DIR and reported to ``progress``;
+    each file's outcome is recorded in the OCR manifest.
     """
+    progress = progress or OCRProgress()
     ocr = OCR()
+    manifest = load_manifest(raw_folder)
 
     if full_folder_process:
-        # Stream every PDF under raw-literature/
-        blobs = bucket.list_blobs(prefix="raw-literature")
-        for b in blobs:
-            if not b.name.lower().endswith(".pdf"):
-                continue
-            base = os.path.splitext(os.path.basename(b.name))[0]
-            print(f"Processing {b.name} (streaming) ...")
-            pdf_bytes = b.download_as_bytes()   # <- in memory
-            text = ocr.perform_ocr(pdf_bytes)   # <- in memory
-            dest = f"processed-literature/{base}.txt"
-            upload_text_to_gcs(text, dest)
+        blobs = list_raw_pdf_blobs(raw_folder)
     else:
         # Incremental mode — stream only unprocessed
-        unprocessed_files = list_unprocessed_files()
-        if not unprocessed_files:
+        blobs = find_unprocessed_blobs(raw_folder, manifest)
+        if not blobs:
             print("No more new files requiring OCR. OCR completed.")
+            progress.files_planned([], [])
+            return {"processed": [], "skipped": [], "failed": {}}
+
+    skipped = []
+    if full_folder_process and not force:
+        skipped = [b.name for b in blobs if manifest.is_current(b.name, b.generation, b.md5_hash)]
+        blobs = [b for b in blobs if b.name not in skipped]
+        for name in skipped:
+            print(f"Skipping {name}: unchanged since last successful OCR")
+    progress.files_planned([b.name for b in blobs], skipped)
+
+    processed, failed = [], {}
+
+    def process(blob):
+        try:
+            stats = ocr_blob(ocr, blob, progress)
+        except Exception as e:
+            print(f"OCR failed for {blob.name}: {e}")
+            failed[blob.name] = str(e)
+            manifest.mark_failed(blob.name, blob.generation, blob.md5_hash, str(e))
+            progress.file_failed(blob.name, str(e))
             return
+        manifest.mark_done(blob.name, blob.generation, blob.md5_hash, stats["output"])
+        processed.append(blob.name)
+        progress.file_finished(blob.name, stats)
 
-        for base_pdf in unprocessed_files:
-            raw_blob = f"raw-literature/{base_pdf}"
-            print(f"Processing {raw_blob} (streaming)...")
-            pdf_bytes = bucket.blob(raw_blob).download_as_bytes()
-            text = ocr.perform_ocr(pdf_bytes)
-            base = os.path.splitext(base_pdf)[0]
-            dest = f"processed-literature/{base}.txt"
-            upload_text_to_gcs(text, dest)
+    with ThreadPoolExecutor(max_workers=max_workers or FILE_CONCURRENCY) as pool:
+        list(pool.map(process, blobs))
 
-        print(f"OCR completed. {len(unprocessed_files)} file(s) processed.")
\ No newline at end of file
+    print(f"OCR completed. {len(processed)} file(s) processed, {len(skipped)} skipped, {len(failed)} failed.")
+    if failed:
+        raise RuntimeError(f"OCR failed for {len(failed)} file(s): " +
+                           "; ".join(f"{name}: {err}" for name, err in failed.items()))
+    return {"processed": processed, "skipped": skipped, "failed": failed}
@@ -0,0 +1,107 @@
+import hashlib
+from collections import Counter
+
+import fitz
+import pytest
+from google.cloud import vision
+
+import OCR as ocr_module
+
+
+def _text_for(content: bytes) -> str:
+    return f"page-{hashlib.sha256(content).hexdigest()[:12]}"
+
+
+class FakeImageAnnotatorClient:
+    """
+    Stands in for vision.ImageAnnotatorClient: the "OCR text" of an image is
+    derived from its bytes. The first ``fail_attempts`` requests for every
+    ``fail_every``-th distinct image return a per-image error.
+    """
+
+    def __init__(self, fail_every: int = 0, fail_attempts: int = 1):
+        self.fail_every = fail_every
+        self.fail_attempts = fail_attempts
+        self.attempts = Counter()
+        self.batch_sizes = []
+        self._order = {}
+
+    def _should_fail(self, content: bytes) -> bool:
+        position = self._order.setdefault(content, len(self._order))
+        return (bool(self.fail_every) and position % self.fail_every == 0
+                and self.attempts[content] <= self.fail_attempts)
+
+    def document_text_detection(self, image):
+        return vision.AnnotateImageResponse(full_text_annotation={"text": _text_for(image.content)})
+
+    def batch_annotate_images(self, requests):
+        self.batch_sizes.append(len(requests))
+        responses = []
+        for request in requests:
+            content = request.image.content
+            self.attempts[content] += 1
+            if self._should_fail(content):
+                responses.append(vision.AnnotateImageResponse(error={"code": 14, "message": "unavailable"}))
+            else:
+                responses.append(vision.AnnotateImageResponse(full_text_annotation={"text": _text_for(content)}))
+        return vision.BatchAnnotateImagesResponse(responses=responses)
+
+
+@pytest.fixture
+def make_ocr(monkeypatch, tmp_path):
+    key_path = tmp_path / "key.json"
+    key_path.write_text("{}")
+    monkeypatch.setenv("GOOGLE_APPLICATION_CREDENTIALS", str(key_path))
+    monkeypatch.setattr(ocr_module.service_account.Credentials, "from_service_account_file", lambda path: None)
+
+    def make(client: FakeImageAnnotatorClient, **kwargs) -> ocr_module.OCR:
+        monkeypatch.setattr(ocr_module.vision, "ImageAnnotatorClient", lambda credentials=None: client)
+        return ocr_module.OCR(use_text_layer=False, retry_delay=0, **kwargs)
+
+    return make
+
+
+@pytest.fixture
+def pdf_bytes() -> bytes:
+    """A scanned-like PDF: 20 pages without a text layer, each drawn differently."""
+    doc = fitz.open()
+    for i in range(20):
+        page = doc.new_page(width=200, height=200)
+        page.draw_rect(fitz.Rect(5 + i * 8, 10, 15 + i * 8, 20 + i * 5), color=(0, 0, 0), fill=(0, 0, 0))
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def test_batch_ocr_matches_serial_and_retries_failed_pages(make_ocr, pdf_bytes):
+    serial_text = make_ocr(FakeImageAnnotatorClient(), batch_size=1).perform_ocr(pdf_bytes)
+
+    client = FakeImageAnnotatorClient(fail_every=5)  # 4 of the 20 pages fail their first request
+    pages = {}
+    batch_text = make_ocr(client, batch_size=8).perform_ocr(
+        pdf_bytes, on_page=lambda page_index, text: pages.__setitem__(page_index, text))
+
+    assert batch_text == serial_text
+    assert len(set(serial_text.split("\n\n"))) == 20
+    assert sorted(pages) == list(range(20))
+    assert sorted(client.attempts.values()) == [1] * 16 + [2] * 4
+    assert sum(client.batch_sizes) == 24  # only the failed pages are re-sent
+    assert max(client.batch_sizes) == 8
+
+
+def test_batch_ocr_pipelined_matches_serial(make_ocr, pdf_bytes):
+    serial_text = make_ocr(FakeImageAnnotatorClient(), batch_size=1).perform_ocr(pdf_bytes)
+
+    client = FakeImageAnnotatorClient(fail_every=3)
+    pipelined = make_ocr(client, batch_size=4, pipelined=True, render_workers=2, max_inflight_requests=2)
+
+    assert pipelined.perform_ocr(pdf_bytes) == serial_text
+    assert max(client.attempts.values()) == 2
+
+
+def test_batch_ocr_gives_up_after_max_retries(make_ocr, pdf_bytes):
+    client = FakeImageAnnotatorClient(fail_every=7, fail_attempts=10)
+
+    with pytest.raises(RuntimeError, match="after 2 retries"):
+        make_ocr(client, batch_size=16, max_retries=2).perform_ocr(pdf_bytes)
+    assert max(client.attempts.values()) == 3
@@ -0,0 +1,86 @@
+import importlib
+import threading
+
+import pytest
+
+from local_gcs import LocalBucket
+from ocr_manifest import OCRManifest
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    return LocalBucket(str(tmp_path / "bucket"))
+
+
+@pytest.fixture
+def runner(monkeypatch, bucket):
+    """run_ocr_main serving ``bucket``; the env var keeps its import from needing GCS credentials."""
+    monkeypatch.setenv("OCR_LOCAL_BUCKET_DIR", bucket.root)
+    module = importlib.import_module("run_ocr_main")
+    monkeypatch.setattr(module, "bucket", bucket)
+    monkeypatch.setattr(module, "MANIFEST_PATH", None)
+    return module
+
+
+def _done(manifest: OCRManifest, name: str):
+    manifest.mark_done(name, 1, "md5", f"processed-literature/{name}.txt")
+
+
+def test_concurrent_managers_keep_each_others_entries(bucket):
+    managers = [OCRManifest(bucket), OCRManifest(bucket)]
+    start = threading.Barrier(len(managers))
+
+    def save_entries(i):
+        start.wait()
+        for j in range(20):
+            _done(managers[i], f"raw-literature/{i}-{j}.pdf")
+
+    threads = [threading.Thread(target=save_entries, args=(i,)) for i in range(len(managers))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stored = OCRManifest(bucket)
+    for i in range(len(managers)):
+        for j in range(20):
+            assert stored.is_current(f"raw-literature/{i}-{j}.pdf", 1, "md5")
+
+
+def test_save_retries_and_merges_after_a_conflicting_write(bucket):
+    mine, other = OCRManifest(bucket), OCRManifest(bucket)
+    _done(mine, "raw-literature/a.pdf")
+    reads = []
+    read = mine._read
+
+    def read_then_lose_the_race():
+        stored = read()
+        if not reads:  # another writer saves between this read and the upload
+            _done(other, "raw-literature/b.pdf")
+        reads.append(stored)
+        return stored
+
+    mine._read = read_then_lose_the_race
+    _done(mine, "raw-literature/c.pdf")
+
+    assert len(reads) == 2
+    stored = OCRManifest(bucket)
+    assert all(stored.is_current(f"raw-literature/{name}.pdf", 1, "md5") for name in "abc")
+
+
+def test_load_manifest_seeds_from_outputs_and_skips_unchanged_pdfs(runner, bucket):
+    for name in ("a", "b"):
+        bucket.blob(f"raw-literature/{name}.pdf").upload_from_string(f"%PDF {name}")
+    bucket.blob("processed-literature/a.txt").upload_from_string("text of a")
+
+    manifest = runner.load_manifest()
+
+    assert manifest.exists
+    assert manifest.get("raw-literature/a.pdf")["output"] == "processed-literature/a.txt"
+    assert [b.name for b in runner.find_unprocessed_blobs(manifest=manifest)] == ["raw-literature/b.pdf"]
+
+    b = bucket.get_blob("raw-literature/b.pdf")
+    manifest.mark_done(b.name, b.generation, b.md5_hash, "processed-literature/b.txt")
+    bucket.blob("raw-literature/a.pdf").upload_from_string("%PDF a, edited")
+
+    assert [b.name for b in runner.find_unprocessed_blobs()] == ["raw-literature/a.pdf"]
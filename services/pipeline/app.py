@@ -9,5 +9,5 @@ def health_check():
 
 @app.post("/run-etl")
 def run_etl():
-    etl.run_etl()
-    return {"status": "ETL complete"}
+    tables = etl.run_etl()
+    return {"status": "ETL complete", "tables": tables}
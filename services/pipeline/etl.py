@@ -1,5 +1,4 @@
-import os, re, io
-import pandas as pd
+import os, re, csv, time
 from sqlalchemy import create_engine
 from google.cloud import storage
 from google.oauth2 import service_account
@@ -14,7 +13,7 @@ DB_HOST = os.getenv("POSTGRES_HOST", "db")  # service name from docker-compose
 DB_PORT = os.getenv("POSTGRES_PORT", "5432")
 
 engine = create_engine(
-    f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 )
 
 # ----------------------------
@@ -29,51 +28,198 @@ credentials = service_account.Credentials.from_service_account_file(KEY_PATH)
 storage_client = storage.Client(project=PROJECT_ID, credentials=credentials)
 bucket = storage_client.bucket(BUCKET_NAME)
 
+# ----------------------------
+# Bulk load settings
+# ----------------------------
+# Bytes fetched from GCS per request and handed to COPY per write; together they
+# bound the loader's memory regardless of the file size
+READ_CHUNK_BYTES = int(os.getenv("ETL_READ_CHUNK_BYTES", str(8 * 1024 * 1024)))
+COPY_BUFFER_BYTES = int(os.getenv("ETL_COPY_BUFFER_BYTES", str(1024 * 1024)))
+
+# Column mapping
+COLUMN_MAP = {
+    "Workout_Frequency (days/week)": "workout_days_per_week",
+    "# Primary Items": "primary_items_count",
+    "# Secondary Items": "secondary_items_count",
+    "Short YouTube Demonstration": "short_demo_url",
+    "In-Depth YouTube Explanation": "long_demo_url",
+    "Movement Pattern #1": "movement_pattern_1",
+    "Movement Pattern #2": "movement_pattern_2",
+    "Movement Pattern #3": "movement_pattern_3",
+    "Plane Of Motion #1": "plane_of_motion_1",
+    "Plane Of Motion #2": "plane_of_motion_2",
+    "Plane Of Motion #3": "plane_of_motion_3",
+    # add more as needed...
+}
+
+# Natural key each table is upserted on (see services/db/init.sql).
+# The tracking file has no id, so its rows are keyed on a hash of their values
+# and of the row's occurrence among identical rows (1 for the first copy, 2 for
+# the second, ...): identical rows are all kept, and reloading the same file
+# matches the same keys.
+ROW_HASH_COLUMN = "row_hash"
+# Table columns that are never filled from a CSV: the serial PK, audit and hash columns
+NON_DATA_COLUMNS = ("id", "created_at", ROW_HASH_COLUMN)
+NATURAL_KEYS = {
+    "gym_recommendation": "source_id",
+    "exercise_catalog": "exercise",
+    "exercise_tracking": ROW_HASH_COLUMN,
+}
+
+
+def normalize_column(name):
+    """CSV header -> table column: COLUMN_MAP, then lowercase/underscores, ID -> source_id."""
+    name = COLUMN_MAP.get(name, name)
+    name = re.sub(r"[^\w]+", "_", name.strip().lower()).strip("_")
+    return "source_id" if name == "id" else name
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _column_list(columns, prefix=""):
+    return ", ".join(prefix + _quote(c) for c in columns)
+
+
+def row_hash_sql(columns, order_column):
+    """md5 of the row values and of its occurrence number among identical rows (ordered by order_column)."""
+    values = f"ROW({_column_list(columns)})::text"
+    return (f"md5({values} || '#' || row_number() OVER (PARTITION BY {values} ORDER BY {_quote(order_column)}))")
+
+
+def table_data_columns(cur, table_name):
+    """Columns filled from the CSV: all of the table's columns except NON_DATA_COLUMNS."""
+    cur.execute(
+        """
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum
+        """,
+        (table_name,),
+    )
+    return [name for (name,) in cur.fetchall() if name not in NON_DATA_COLUMNS]
+
+
+def ensure_natural_key(cur, table_name, data_columns):
+    """
+    Create the unique index on the natural key if the table predates it
+    (fresh databases get it from init.sql). Rows appended more than once by
+    the old to_sql loader are removed first, keeping the oldest copy. Tracking
+    rows have no id to tell such copies from identical real rows, so they are
+    all kept and numbered as occurrences like a load would.
+    """
+    key = NATURAL_KEYS[table_name]
+    index_name = f"{table_name}_{key}_key"
+    cur.execute("SELECT to_regclass(%s)", (index_name,))
+    if cur.fetchone()[0] is not None:
+        return
+    print(f"Adding unique key {index_name}...")
+    if key == ROW_HASH_COLUMN:
+        cur.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {key} CHAR(32)")
+        cur.execute(
+            f"UPDATE {table_name} t SET {key} = h.{key} "
+            f"FROM (SELECT id, {row_hash_sql(data_columns, 'id')} AS {key} FROM {table_name}) h WHERE t.id = h.id"
+        )
+    cur.execute(f"DELETE FROM {table_name} a USING {table_name} b WHERE a.{key} = b.{key} AND a.id > b.id")
+    cur.execute(f"CREATE UNIQUE INDEX {index_name} ON {table_name} ({key})")
+
+
+def upsert_from_stage(cur, table_name, stage, data_columns):
+    """Insert new keys, update changed rows; within the file the last row of a key wins."""
+    key = NATURAL_KEYS[table_name]
+    if key == ROW_HASH_COLUMN:
+        columns = data_columns + [key]
+        source = (f"SELECT {_column_list(data_columns)}, {row_hash_sql(data_columns, '_row')} AS {key}, _row "
+                  f"FROM {stage}")
+        on_conflict = "DO NOTHING"  # same hash, same values and occurrence
+    else:
+        columns = data_columns
+        source = f"SELECT * FROM {stage} WHERE {_quote(key)} IS NOT NULL"
+        updated = [c for c in data_columns if c != key]
+        on_conflict = (
+            f"DO UPDATE SET ({_column_list(updated)}) = ROW({_column_list(updated, 'EXCLUDED.')}) "
+            f"WHERE ({_column_list(updated, 't.')}) IS DISTINCT FROM ({_column_list(updated, 'EXCLUDED.')})"
+        )
+    cur.execute(
+        f"""
+        INSERT INTO {table_name} AS t ({_column_list(columns)})
+        SELECT DISTINCT ON ({_quote(key)}) {_column_list(columns)}
+        FROM ({source}) s
+        ORDER BY {_quote(key)}, _row DESC
+        ON CONFLICT ({_quote(key)}) {on_conflict}
+        """
+    )
+    return cur.rowcount
+
 
 def load_csv_to_table(blob_name, table_name):
+    """
+    Stream a CSV from GCS into Postgres with COPY and upsert it on the table's
+    natural key. Only the header is parsed in Python: it is mapped to table
+    columns, and the data rows go from the GCS reader straight into
+    COPY ... FROM STDIN of a temp staging table, in chunks.
+    """
     print(f"Loading gs://{BUCKET_NAME}/{blob_name} into {table_name}...")
+    start = time.perf_counter()
+    stage = f"{table_name}_stage"
 
-    # Read file directly from GCS into memory
     blob = bucket.blob(blob_name)
-    csv_bytes = blob.download_as_bytes()
-    df = pd.read_csv(io.BytesIO(csv_bytes))
-
-    # Column mapping
-    COLUMN_MAP = {
-        "Workout_Frequency (days/week)": "workout_days_per_week",
-        "# Primary Items": "primary_items_count",
-        "# Secondary Items": "secondary_items_count",
-        "Short YouTube Demonstration": "short_demo_url",
-        "In-Depth YouTube Explanation": "long_demo_url",
-        "Movement Pattern #1": "movement_pattern_1",
-        "Movement Pattern #2": "movement_pattern_2",
-        "Movement Pattern #3": "movement_pattern_3",
-        "Plane Of Motion #1": "plane_of_motion_1",
-        "Plane Of Motion #2": "plane_of_motion_2",
-        "Plane Of Motion #3": "plane_of_motion_3",
-        # add more as needed...
-    }
-    df.rename(columns=COLUMN_MAP, inplace=True)
-
-    # Standardize column names: lowercase and underscores
-    df.columns = [
-        re.sub(r"[^\w]+", "_", c.strip().lower()).strip("_") for c in df.columns
-    ]
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        with blob.open("rb", chunk_size=READ_CHUNK_BYTES) as reader:
+            header = next(csv.reader([reader.readline().decode("utf-8-sig")]))
+            file_columns = [normalize_column(c) for c in header]
+
+            data_columns = table_data_columns(cur, table_name)
+            key = NATURAL_KEYS[table_name]
+            if key != ROW_HASH_COLUMN and key not in file_columns:
+                raise ValueError(f"{blob_name} has no column for the natural key '{key}' of {table_name}")
+            ensure_natural_key(cur, table_name, data_columns)
 
-    # Rename ID -> source_id if present
-    if "id" in df.columns:
-        df = df.rename(columns={"id": "source_id"})
+            # Staging table: the table's data columns (typed, so bad values fail at COPY with a
+            # line number), extra file columns as text, and the file row number
+            cur.execute(
+                f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS "
+                f"SELECT {_column_list(data_columns)} FROM {table_name} WITH NO DATA"
+            )
+            extra = [c for c in dict.fromkeys(file_columns) if c not in data_columns]
+            if extra:
+                print(f"⚠️ Ignoring columns not in {table_name}: {extra}")
+            for column in extra:
+                cur.execute(f"ALTER TABLE {stage} ADD COLUMN {_quote(column)} TEXT")
+            cur.execute(f"ALTER TABLE {stage} ADD COLUMN _row BIGSERIAL")
 
-    # Write to Postgres
-    df.to_sql(table_name, engine, if_exists="append", index=False)
-    print(f"✅ Loaded {len(df)} rows into {table_name}")
+            # Empty fields (quoted or not) load as NULL, like pandas' NaN did
+            cur.copy_expert(
+                f"COPY {stage} ({_column_list(file_columns)}) FROM STDIN "
+                f"WITH (FORMAT csv, FORCE_NULL ({_column_list(file_columns)}))",
+                reader,
+                size=COPY_BUFFER_BYTES,
+            )
+            staged = cur.rowcount
+
+        changed = upsert_from_stage(cur, table_name, stage, data_columns)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    seconds = time.perf_counter() - start
+    print(f"✅ Loaded {staged} rows into {table_name} ({changed} inserted or updated) in {seconds:.1f}s")
+    return {"table": table_name, "rows": staged, "inserted_or_updated": changed, "seconds": seconds}
 
 
 def run_etl():
-    load_csv_to_table("raw-data/gym_recommendation.csv", "gym_recommendation")
-    load_csv_to_table("raw-data/gym_members_exercise_tracking.csv", "exercise_tracking")
-    load_csv_to_table("raw-data/exercise_catalog.csv", "exercise_catalog")
+    return [
+        load_csv_to_table("raw-data/gym_recommendation.csv", "gym_recommendation"),
+        load_csv_to_table("raw-data/gym_members_exercise_tracking.csv", "exercise_tracking"),
+        load_csv_to_table("raw-data/exercise_catalog.csv", "exercise_catalog"),
+    ]
 
 
 if __name__ == "__main__":
-    run_etl()
\ No newline at end of file
+    run_etl()
@@ -1,64 +1,174 @@
+import asyncio
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+import json
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 import rag_core
+import ingest_jobs
 
 app = FastAPI(title="FitAI RAG Pipeline", version="1.0.0")
+ingest_job_manager = ingest_jobs.IngestJobManager()
 
 # 定义API请求的格式
 class GCSProcessRequest(BaseModel):
     bucket_name: str
     folder_path: str = ""
     method: str = "char-split" #可以不提供，默认用char-split
+    incremental: bool = False #只处理新增/修改/删除的文件
+    pipeline_workers: Optional[Dict[str, int]] = None #各阶段worker数量: download/split/embed/upsert
+    background: bool = False #立即返回job_id，在后台处理
 
 class QueryRequest(BaseModel):
     query: str
     method: str = "char-split"
     n_results: int = 5
+    retrieval: Literal["vector", "lexical", "hybrid"] = "vector"
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    method: str = "char-split"
+    n_results: int = 5
 
 class ChatRequest(BaseModel):
     query: str
     method: str = "char-split"
     n_results: int = 10
+    retrieval: Literal["vector", "lexical", "hybrid"] = "vector"
 
 
 # API 端点
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "ok", "service": "rag_pipeline"}
 
+@app.get("/health/chromadb")
+async def chromadb_health():
+    """ChromaDB heartbeat latency and cached collection handles"""
+    health = await rag_core.api_chromadb_health()
+    if health["status"] != "ok":
+        raise HTTPException(status_code=503, detail=health)
+    return health
+
 @app.post("/process-gcs")
-def process_gcs_to_chromadb(request: GCSProcessRequest):
-    """一键处理: 从GCS下载文件 -> 分块 -> 生成嵌入 -> 存储到ChromaDB"""
+async def process_gcs_to_chromadb(request: GCSProcessRequest):
+    """一键处理: 从GCS下载文件 -> 分块 -> 生成嵌入 -> 存储到ChromaDB（在工作线程中运行，不阻塞其他请求）"""
     try:
-        return rag_core.api_process_gcs_to_chromadb(
-            request.bucket_name, 
-            request.folder_path, 
-            request.method
+        job = ingest_job_manager.submit(
+            rag_core.api_process_gcs_to_chromadb,
+            request.method,
+            bucket_name=request.bucket_name,
+            folder_path=request.folder_path,
+            incremental=request.incremental,
+            pipeline_workers=request.pipeline_workers
         )
+    except ingest_jobs.IngestConflictError as e:
+        return JSONResponse(
+            status_code=409,
+            content={"status": "conflict", "message": str(e), "job_id": e.job_id}
+        )
+    if request.background:
+        return JSONResponse(status_code=202, content={
+            "status": "started",
+            "job_id": job.id,
+            "status_url": f"/process-gcs/jobs/{job.id}"
+        })
+    try:
+        return await asyncio.shield(job.task)  # keep running if the client disconnects
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/process-gcs/jobs")
+async def list_ingest_jobs():
+    """List recent ingest jobs"""
+    return {"jobs": [
+        {k: v for k, v in job.to_dict().items() if k != "result"}
+        for job in ingest_job_manager.list()
+    ]}
+
+@app.get("/process-gcs/jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    """Status and result of a background ingest job"""
+    job = ingest_job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingest job '{job_id}' not found")
+    return job.to_dict()
+
 @app.post("/query")
-def query_vector_db(request: QueryRequest):
+async def query_vector_db(request: QueryRequest):
     """Query vector database for similar chunks"""
     try:
-        return rag_core.api_query_vector_db(request.query, request.method, request.n_results)
+        return await rag_core.api_query_vector_db(
+            request.query, request.method, request.n_results, request.retrieval)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/query/batch")
+async def query_vector_db_batch(request: BatchQueryRequest):
+    """Query vector database for many queries at once (results in query order)"""
+    try:
+        return await rag_core.api_query_vector_db_batch(request.queries, request.method, request.n_results)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/chat")
-def chat_with_llm(request: ChatRequest):
+async def chat_with_llm(request: ChatRequest):
     """Chat with LLM using retrieved context"""
     try:
-        return rag_core.api_chat_with_llm(request.query, request.method, request.n_results)
+        return await rag_core.api_chat_with_llm(
+            request.query, request.method, request.n_results, request.retrieval)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat/stream")
+async def chat_with_llm_stream(request: ChatRequest):
+    """Chat with LLM, streaming the answer as Server-Sent Events.
+    The first event ("context") carries the retrieved chunk metadata, then one
+    "token" event per generated text chunk, then "done" (or "error")."""
+    async def event_stream():
+        async for event, data in rag_core.api_chat_with_llm_stream(
+                request.query, request.method, request.n_results, retrieval=request.retrieval):
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/collections")
-def list_collections():
+async def list_collections():
     """List all available collections"""
     try:
-        return rag_core.api_list_collections()
+        return await rag_core.api_list_collections()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/local-index")
+async def local_index_stats():
+    """Retrieval backend per method and the loaded in-process indexes"""
+    return rag_core.api_local_index_stats()
+
+@app.post("/local-index/{method}/refresh")
+async def refresh_local_index(method: str):
+    """Rebuild the in-process index snapshots (BM25, and exact/ivf if configured) of a method from its Chroma collection"""
+    try:
+        return await asyncio.to_thread(rag_core.api_refresh_local_index, method)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/embedding-cache")
+async def embedding_cache_stats():
+    """Embedding cache hit/miss counters"""
+    try:
+        return rag_core.api_embedding_cache_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/query-cache")
+async def query_cache_stats():
+    """Query/chat response cache hit/miss counters"""
+    try:
+        return rag_core.api_query_cache_stats()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,132 @@
+"""Long-lived ChromaDB clients with cached collection handles.
+
+One ``chromadb.HttpClient`` (used by ingest, from worker threads) and one
+``chromadb.AsyncHttpClient`` (used by the async request handlers) per
+process keep their pooled keep-alive HTTP connections, and resolved collection
+handles are cached by name, so a query costs one round trip instead of
+client setup + ``get_collection`` + query. A cached handle is re-resolved
+only after ``invalidate(name)`` (the ingest path calls it when it recreates
+or swaps a collection) or when Chroma reports that the collection no longer
+exists.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import chromadb
+
+T = TypeVar("T")
+
+
+def is_collection_missing(e: BaseException) -> bool:
+    """True if Chroma rejected the request because the collection is gone."""
+    if type(e).__name__ in ("NotFoundError", "InvalidCollectionException"):
+        return True
+    message = str(e).lower()
+    return "does not exist" in message or "not found" in message
+
+
+class ChromaClientManager:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._client = None
+        self._async_client = None
+        self._collections: Dict[str, object] = {}
+        self._async_collections: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._async_lock = asyncio.Lock()
+        self._counters = {"clients_created": 0, "handle_hits": 0, "handle_resolves": 0, "handle_invalidations": 0}
+
+    @property
+    def client(self):
+        """The shared HttpClient, created on first use."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = chromadb.HttpClient(host=self.host, port=self.port)
+                    self._counters["clients_created"] += 1
+        return self._client
+
+    async def aclient(self):
+        """The shared AsyncHttpClient, created on first use."""
+        if self._async_client is None:
+            async with self._async_lock:
+                if self._async_client is None:
+                    self._async_client = await chromadb.AsyncHttpClient(host=self.host, port=self.port)
+                    with self._lock:
+                        self._counters["clients_created"] += 1
+        return self._async_client
+
+    def get_collection(self, name: str):
+        """Cached handle of an existing collection; resolves it on first use."""
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is not None:
+                self._counters["handle_hits"] += 1
+                return collection
+        collection = self.client.get_collection(name=name)
+        with self._lock:
+            self._collections[name] = collection
+            self._counters["handle_resolves"] += 1
+        return collection
+
+    async def aget_collection(self, name: str):
+        """Cached async handle of an existing collection."""
+        with self._lock:
+            collection = self._async_collections.get(name)
+            if collection is not None:
+                self._counters["handle_hits"] += 1
+                return collection
+        collection = await (await self.aclient()).get_collection(name=name)
+        with self._lock:
+            self._async_collections[name] = collection
+            self._counters["handle_resolves"] += 1
+        return collection
+
+    async def awith_collection(self, name: str, fn: Callable[[object], Awaitable[T]]) -> T:
+        """
+        Await ``fn(collection)``; if the cached handle points at a collection that
+        was deleted or recreated elsewhere, re-resolve it once and retry.
+        """
+        collection = await self.aget_collection(name)
+        try:
+            return await fn(collection)
+        except Exception as e:
+            if not is_collection_missing(e):
+                raise
+            self.invalidate(name)
+            return await fn(await self.aget_collection(name))
+
+    def invalidate(self, name: Optional[str] = None):
+        """Forget the cached (sync and async) handles of ``name`` (all handles if None)."""
+        with self._lock:
+            for handles in (self._collections, self._async_collections):
+                if name is None:
+                    handles.clear()
+                else:
+                    handles.pop(name, None)
+            self._counters["handle_invalidations"] += 1
+
+    async def health(self) -> dict:
+        """Heartbeat round trip through the pooled async client."""
+        start = time.perf_counter()
+        try:
+            await (await self.aclient()).heartbeat()
+            status, error = "ok", None
+        except Exception as e:
+            status, error = "unavailable", str(e)
+        with self._lock:
+            stats = dict(self._counters)
+            cached = sorted(set(self._collections) | set(self._async_collections))
+        return {
+            "status": status,
+            "error": error,
+            "host": self.host,
+            "port": self.port,
+            "latency_ms": (time.perf_counter() - start) * 1000,
+            "cached_collections": cached,
+            **stats,
+        }
@@ -0,0 +1,149 @@
+"""Context assembly for /chat: retrieved chunks -> prompt context.
+
+1. Chunks of the same source with consecutive ids (``{id_prefix}-{i}``, the
+   prefix hashes the source's GCS path, see ``rag_core.chunk_id_prefix``) are
+   merged into one passage and the text they share (the char-split /
+   recursive-split overlap) is kept once.
+2. Passages that are near-duplicates of a better ranked passage (word
+   shingle Jaccard similarity, or containment) are dropped.
+3. Passages are added in relevance order until the token budget is used up;
+   a first passage larger than the budget is truncated.
+
+Token counts are estimated (about 4 characters per token) so no tokenizer
+round trip is needed.
+"""
+
+import math
+import re
+from typing import List, Optional, Sequence, Set, Tuple
+
+_WORD = re.compile(r"\w+")
+CHUNK_SEPARATOR = "\n\n---\n"
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4)
+
+
+def _parse_chunk_id(chunk_id: str) -> Tuple[str, Optional[int]]:
+    id_prefix, _, index = chunk_id.rpartition("-")
+    if not id_prefix or not index.isdigit():
+        return chunk_id, None
+    return id_prefix, int(index)
+
+
+def _overlap(left: str, right: str, max_overlap: int) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``."""
+    for k in range(min(len(left), len(right), max_overlap), 0, -1):
+        if left.endswith(right[:k]):
+            return k
+    return 0
+
+
+def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class Passage:
+    __slots__ = ("text", "rank", "chunk_ids", "source")
+
+    def __init__(self, text: str, rank: int, chunk_ids: List[str], source):
+        self.text = text
+        self.rank = rank
+        self.chunk_ids = chunk_ids
+        self.source = source
+
+
+def merge_adjacent_chunks(documents: Sequence[str], ids: Sequence[str], metadatas: Sequence[dict] = None,
+                          max_overlap: int = 400) -> List[Passage]:
+    """Merge runs of consecutive chunks of the same source; passages keep their best rank."""
+    metadatas = metadatas or [{}] * len(documents)
+    by_source = {}
+    for rank, (document, chunk_id, metadata) in enumerate(zip(documents, ids, metadatas)):
+        id_prefix, index = _parse_chunk_id(chunk_id)
+        by_source.setdefault(id_prefix, []).append((index, rank, chunk_id, document, (metadata or {}).get("source")))
+
+    passages = []
+    for chunks in by_source.values():
+        chunks.sort(key=lambda c: (c[0] is None, c[0] or 0, c[1]))
+        current = None
+        previous_index = None
+        for index, rank, chunk_id, document, source in chunks:
+            if current is not None and index is not None and previous_index is not None and index == previous_index + 1:
+                overlap = _overlap(current.text, document, max_overlap)
+                current.text += document[overlap:]
+                current.rank = min(current.rank, rank)
+                current.chunk_ids.append(chunk_id)
+            else:
+                current = Passage(document, rank, [chunk_id], source)
+                passages.append(current)
+            previous_index = index
+    passages.sort(key=lambda p: p.rank)
+    return passages
+
+
+def drop_near_duplicates(passages: List[Passage], threshold: float = 0.8) -> Tuple[List[Passage], int]:
+    """Drop passages whose shingle Jaccard similarity with a better ranked one is >= threshold."""
+    kept, kept_shingles, dropped = [], [], 0
+    for passage in passages:
+        shingles = _shingles(passage.text)
+        duplicate = False
+        for other, other_shingles in zip(kept, kept_shingles):
+            if passage.text.strip() in other.text:
+                duplicate = True
+            elif shingles and other_shingles:
+                jaccard = len(shingles & other_shingles) / len(shingles | other_shingles)
+                duplicate = jaccard >= threshold
+            if duplicate:
+                break
+        if duplicate:
+            dropped += 1
+            continue
+        kept.append(passage)
+        kept_shingles.append(shingles)
+    return kept, dropped
+
+
+def assemble_context(documents: Sequence[str], ids: Sequence[str], metadatas: Sequence[dict] = None,
+                     token_budget: int = 2000, dedup_threshold: float = 0.8) -> Tuple[str, dict]:
+    """
+    Return ``(context, report)``. ``report`` compares the estimated tokens of
+    the naive context (all documents joined) with the assembled one.
+    """
+    original_tokens = estimate_tokens(CHUNK_SEPARATOR.join(documents))
+    passages = merge_adjacent_chunks(documents, ids, metadatas)
+    merged_passages = len(passages)
+    passages, duplicates = drop_near_duplicates(passages, dedup_threshold)
+
+    selected, used, over_budget, truncated = [], 0, 0, False
+    separator_tokens = estimate_tokens(CHUNK_SEPARATOR)
+    for passage in passages:
+        cost = estimate_tokens(passage.text) + (separator_tokens if selected else 0)
+        if used + cost <= token_budget:
+            selected.append(passage.text)
+            used += cost
+        elif not selected:
+            selected.append(passage.text[:token_budget * 4])
+            used = estimate_tokens(selected[0])
+            truncated = True
+        else:
+            over_budget += 1
+
+    context = CHUNK_SEPARATOR.join(selected)
+    context_tokens = estimate_tokens(context)
+    report = {
+        "chunks_in": len(documents),
+        "passages_out": len(selected),
+        "chunks_merged": len(documents) - merged_passages,
+        "duplicates_dropped": duplicates,
+        "over_budget_dropped": over_budget,
+        "truncated": truncated,
+        "token_budget": token_budget,
+        "original_tokens": original_tokens,
+        "context_tokens": context_tokens,
+        "tokens_saved": original_tokens - context_tokens,
+    }
+    return context, report
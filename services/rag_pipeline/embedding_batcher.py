@@ -0,0 +1,146 @@
+"""Concurrent batch execution with an adaptive token-bucket rate limiter.
+
+``run_batches_concurrently`` keeps up to ``max_workers`` batches in flight
+against any ``embed_fn(batch) -> list`` callable, retries each batch on its
+own, and returns the results in input order. All callers can share one
+``AdaptiveRateLimiter``: it halves its request rate when the backend reports
+throttling (429 / RESOURCE_EXHAUSTED / quota) and creeps back up towards the
+configured rate on success (AIMD).
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Any, Callable, List, Sequence, Tuple, Type
+
+
+def is_throttle_error(e: BaseException) -> bool:
+    """True if the error looks like a rate-limit / quota rejection."""
+    if getattr(e, "code", None) == 429 or getattr(e, "status_code", None) == 429:
+        return True
+    message = str(e).lower()
+    return "429" in message or "resource_exhausted" in message or "quota" in message
+
+
+class AdaptiveRateLimiter:
+    """Thread-safe token bucket whose refill rate adapts to throttling."""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float = None,
+        min_rate: float = 0.2,
+        decrease_factor: float = 0.5,
+        increase_step: float = None,
+        cooldown: float = 1.0,
+    ):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = min(min_rate, self.max_rate)
+        self.capacity = float(burst) if burst is not None else max(1.0, self.max_rate)
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step if increase_step is not None else self.max_rate * 0.05
+        self.cooldown = cooldown
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._counters = {"acquired": 0, "throttled": 0, "rate_decreases": 0, "wait_seconds": 0.0}
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """Block until a request token is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    self._counters["acquired"] += 1
+                    return
+                wait_time = (1.0 - self._tokens) / self.rate
+                self._counters["wait_seconds"] += wait_time
+            time.sleep(wait_time)
+
+    def on_throttle(self):
+        """Multiplicative decrease; concurrent signals within ``cooldown`` count once."""
+        with self._lock:
+            self._counters["throttled"] += 1
+            now = time.monotonic()
+            if now - self._last_decrease < self.cooldown:
+                return
+            self._last_decrease = now
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self._tokens = min(self._tokens, 0.0)
+            self._counters["rate_decreases"] += 1
+
+    def on_success(self):
+        """Additive increase back towards the configured rate."""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["rate"] = self.rate
+            stats["max_rate"] = self.max_rate
+        return stats
+
+
+def run_batches_concurrently(
+    batches: Sequence[Any],
+    embed_fn: Callable[[Any], List[Any]],
+    max_workers: int = 4,
+    limiter: AdaptiveRateLimiter = None,
+    max_retries: int = 5,
+    retry_delay: float = 5,
+    retryable: Tuple[Type[BaseException], ...] = (Exception,),
+    is_throttle: Callable[[BaseException], bool] = is_throttle_error,
+) -> List[Any]:
+    """Run ``embed_fn`` over every batch with bounded concurrency.
+
+    Returns one result per batch, in the same order as ``batches``. A batch
+    that keeps failing after ``max_retries`` retries aborts the whole call.
+    """
+    results: List[Any] = [None] * len(batches)
+
+    def run_one(idx: int):
+        attempt = 0
+        while True:
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                result = embed_fn(batches[idx])
+            except retryable as e:
+                attempt += 1
+                if limiter is not None and is_throttle(e):
+                    limiter.on_throttle()
+                if attempt > max_retries:
+                    raise Exception(f"Failed to generate embeddings after {max_retries} attempts: {str(e)}")
+                # Jittered exponential backoff, only this batch waits
+                time.sleep(retry_delay * (2 ** (attempt - 1)) * random.uniform(0.5, 1.0))
+                continue
+            if limiter is not None:
+                limiter.on_success()
+            results[idx] = result
+            return
+
+    if max_workers <= 1 or len(batches) <= 1:
+        for idx in range(len(batches)):
+            run_one(idx)
+        return results
+
+    pool = ThreadPoolExecutor(max_workers=min(max_workers, len(batches)))
+    try:
+        futures = [pool.submit(run_one, idx) for idx in range(len(batches))]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in done:
+            future.result()  # re-raise the first failure
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    return results
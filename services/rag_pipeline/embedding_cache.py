@@ -0,0 +1,147 @@
+"""Content-addressed embedding cache.
+
+Embeddings are keyed by ``(model, dimensionality, sha256(text))`` so that the
+same text embedded with the same model settings is only ever sent to Vertex
+once. There are two tiers:
+
+* an in-process LRU with size-based eviction (bytes of vector data), and
+* a persistent SQLite backend storing raw float32 vectors.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# SQLite caps the number of bound parameters per statement
+_SQLITE_MAX_PARAMS = 500
+
+
+def text_hash(text: str) -> str:
+    """sha256 hex digest of the text, used as the content address."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier (memory LRU + SQLite) cache of float32 embedding vectors."""
+
+    def __init__(self, path: Optional[str] = None, max_memory_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.max_memory_bytes = max_memory_bytes
+        self._lru: "OrderedDict[Tuple[str, int, str], np.ndarray]" = OrderedDict()
+        self._lru_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+
+        self._conn = None
+        if path:
+            parent = os.path.dirname(path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (model, dim, text_hash)
+                ) WITHOUT ROWID
+                """
+            )
+            self._conn.commit()
+
+    # ---- memory tier ----
+    def _lru_get(self, key):
+        vector = self._lru.get(key)
+        if vector is not None:
+            self._lru.move_to_end(key)
+        return vector
+
+    def _lru_put(self, key, vector: np.ndarray):
+        old = self._lru.pop(key, None)
+        if old is not None:
+            self._lru_bytes -= old.nbytes
+        if vector.nbytes > self.max_memory_bytes:
+            return
+        self._lru[key] = vector
+        self._lru_bytes += vector.nbytes
+        while self._lru_bytes > self.max_memory_bytes:
+            _, evicted = self._lru.popitem(last=False)
+            self._lru_bytes -= evicted.nbytes
+
+    # ---- public API ----
+    def get_many(self, model: str, dimensionality: int, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Return the cached vector for each text, or None for misses."""
+        hashes = [text_hash(t) for t in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        pending: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for i, h in enumerate(hashes):
+                vector = self._lru_get((model, dimensionality, h))
+                if vector is not None:
+                    results[i] = vector
+                    self._counters["memory_hits"] += 1
+                else:
+                    pending.setdefault(h, []).append(i)
+
+            if pending and self._conn is not None:
+                keys = list(pending.keys())
+                for start in range(0, len(keys), _SQLITE_MAX_PARAMS):
+                    part = keys[start:start + _SQLITE_MAX_PARAMS]
+                    placeholders = ",".join("?" * len(part))
+                    rows = self._conn.execute(
+                        f"SELECT text_hash, vector FROM embeddings "
+                        f"WHERE model = ? AND dim = ? AND text_hash IN ({placeholders})",
+                        [model, dimensionality, *part],
+                    ).fetchall()
+                    for h, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        self._lru_put((model, dimensionality, h), vector)
+                        for i in pending.pop(h):
+                            results[i] = vector
+                            self._counters["disk_hits"] += 1
+
+            self._counters["misses"] += sum(len(v) for v in pending.values())
+        return results
+
+    def put_many(self, model: str, dimensionality: int, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """Store vectors for the given texts in both tiers."""
+        rows = []
+        with self._lock:
+            for text, values in zip(texts, vectors):
+                h = text_hash(text)
+                vector = np.asarray(values, dtype=np.float32)
+                self._lru_put((model, dimensionality, h), vector)
+                rows.append((model, dimensionality, h, vector.tobytes()))
+            if self._conn is not None and rows:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, dim, text_hash, vector) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                self._conn.commit()
+            self._counters["writes"] += len(rows)
+
+    def get(self, model: str, dimensionality: int, text: str) -> Optional[np.ndarray]:
+        return self.get_many(model, dimensionality, [text])[0]
+
+    def put(self, model: str, dimensionality: int, text: str, vector: Sequence[float]):
+        self.put_many(model, dimensionality, [text], [vector])
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+            stats["memory_entries"] = len(self._lru)
+            stats["memory_bytes"] = self._lru_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,99 @@
+"""Ingest runs off the event loop.
+
+``api_process_gcs_to_chromadb`` is blocking (GCS downloads, Vertex batches,
+Chroma writes), so every run goes through ``IngestJobManager``: the work
+runs in a worker thread while the event loop keeps serving /query and
+/chat. A caller either awaits ``job.task`` or returns the job id right away
+and lets the client poll ``GET /process-gcs/jobs/{job_id}``. Only one run per
+method (i.e. per collection) at a time, since runs share the staging
+collection and the index manifest.
+"""
+
+import asyncio
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+
+class IngestConflictError(Exception):
+    """Raised when an ingest run for the same method is already queued or running."""
+
+    def __init__(self, job_id: str, method: str):
+        super().__init__(f"Ingest job {job_id} is already running for method '{method}'")
+        self.job_id = job_id
+        self.method = method
+
+
+class IngestJob:
+    def __init__(self, method: str, params: dict):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.params = params
+        self.status = "running"
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "method": self.method,
+            "params": self.params,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "elapsed_seconds": (self.finished_at or time.time()) - self.created_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class IngestJobManager:
+    def __init__(self, history: int = 50):
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._active: Dict[str, str] = {}  # method -> job id
+        self._history = history
+
+    def submit(self, fn: Callable[..., dict], method: str, **params: Any) -> IngestJob:
+        """Start ``fn(method=method, **params)`` in a worker thread; must be called on the event loop."""
+        if method in self._active:
+            raise IngestConflictError(self._active[method], method)
+        job = IngestJob(method, params)
+        self._jobs[job.id] = job
+        self._active[method] = job.id
+        self._trim()
+        job.task = asyncio.get_running_loop().create_task(self._run(job, fn))
+        # background runs are never awaited; their error is kept on the job
+        job.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return job
+
+    async def _run(self, job: IngestJob, fn: Callable[..., dict]) -> dict:
+        try:
+            job.result = await asyncio.to_thread(fn, method=job.method, **job.params)
+            job.status = "completed"
+            return job.result
+        except Exception as e:
+            print(f"Ingest job {job.id} failed:")
+            print(traceback.format_exc())
+            job.error = str(e)
+            job.status = "failed"
+            raise
+        finally:
+            job.finished_at = time.time()
+            self._active.pop(job.method, None)
+
+    def _trim(self):
+        """Drop the oldest finished jobs beyond the history limit."""
+        finished = [jid for jid, j in self._jobs.items() if j.status in ("completed", "failed")]
+        for jid in finished[:max(0, len(self._jobs) - self._history)]:
+            del self._jobs[jid]
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[IngestJob]:
+        return list(self._jobs.values())
@@ -0,0 +1,117 @@
+"""Bounded-queue, multi-stage ingest pipeline.
+
+Each stage runs ``workers`` threads that pull items from a bounded input
+queue, apply the stage function and push the result to the next stage's
+queue. Because every queue is bounded, a slow stage (e.g. embedding) applies
+backpressure all the way to the producer, so the number of items held in
+memory is bounded by ``queue_size * number_of_stages`` plus the items in
+flight, independent of how many items are fed in.
+
+A stage function may return ``None`` to drop an item. The first exception
+raised by any stage stops the feed, the remaining items are drained without
+being processed, and the exception is re-raised from ``run``.
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, List, Optional
+
+_DONE = object()
+
+
+class Stage:
+    def __init__(self, name: str, fn: Callable[[Any], Any], workers: int = 1):
+        if workers < 1:
+            raise ValueError(f"Stage '{name}' needs at least one worker, got {workers}")
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+
+
+class IngestPipeline:
+    def __init__(self, stages: List[Stage], queue_size: int = 8):
+        if not stages:
+            raise ValueError("IngestPipeline needs at least one stage")
+        self.stages = stages
+        self.queue_size = queue_size
+        self._error: Optional[BaseException] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            s.name: {"workers": s.workers, "items_in": 0, "items_out": 0, "busy_seconds": 0.0}
+            for s in stages
+        }
+
+    def _fail(self, exc: BaseException):
+        with self._lock:
+            if self._error is None:
+                self._error = exc
+        self._stop.set()
+
+    def _worker(self, idx: int, in_q: queue.Queue, out_q: Optional[queue.Queue], remaining: list):
+        stage = self.stages[idx]
+        stats = self._stats[stage.name]
+        while True:
+            item = in_q.get()
+            if item is _DONE:
+                break
+            if self._stop.is_set():
+                continue  # drain without processing
+            start = time.perf_counter()
+            try:
+                result = stage.fn(item)
+            except BaseException as e:  # noqa: BLE001 - re-raised from run()
+                self._fail(e)
+                continue
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stats["items_in"] += 1
+                stats["busy_seconds"] += elapsed
+                if result is not None:
+                    stats["items_out"] += 1
+            if result is not None and out_q is not None:
+                out_q.put(result)
+
+        # Last worker of this stage closes the next stage
+        with self._lock:
+            remaining[idx] -= 1
+            last = remaining[idx] == 0
+        if last and out_q is not None:
+            for _ in range(self.stages[idx + 1].workers):
+                out_q.put(_DONE)
+
+    def run(self, items: Iterable[Any]) -> dict:
+        """Feed ``items`` through all stages and block until they are done."""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        remaining = [s.workers for s in self.stages]
+        threads = []
+        for idx, stage in enumerate(self.stages):
+            out_q = queues[idx + 1] if idx + 1 < len(queues) else None
+            for w in range(stage.workers):
+                t = threading.Thread(
+                    target=self._worker,
+                    args=(idx, queues[idx], out_q, remaining),
+                    name=f"ingest-{stage.name}-{w}",
+                    daemon=True,
+                )
+                t.start()
+                threads.append(t)
+
+        start = time.perf_counter()
+        try:
+            for item in items:
+                if self._stop.is_set():
+                    break
+                queues[0].put(item)
+        except BaseException as e:  # noqa: BLE001 - re-raised below
+            self._fail(e)
+        finally:
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_DONE)
+            for t in threads:
+                t.join()
+
+        if self._error is not None:
+            raise self._error
+        return {"wall_seconds": time.perf_counter() - start, "stages": self._stats}
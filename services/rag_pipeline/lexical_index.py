@@ -0,0 +1,142 @@
+"""BM25 inverted index over the chunks of a collection.
+
+Short queries with exact terms ("RPE", "Romanian deadlift", "creatine
+monohydrate") are matched lexically, without an embedding round trip. The
+index uses the same chunk ids as the Chroma collection, so its results can be
+fused with vector results (``reciprocal_rank_fusion``).
+
+Postings are stored in CSR form: for term ``t`` the documents are
+``postings[offsets[t]:offsets[t + 1]]`` (uint32 row numbers, ascending) and
+``frequencies`` holds the matching term frequencies (uint16). Snapshots are
+saved and published through ``vector_index.LocalIndexStore`` like the vector
+indexes::
+
+    {version}/index.json, terms.json, records.json, offsets.npy, postings.npy, frequencies.npy, lengths.npy
+"""
+
+import json
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from vector_index import _top_k
+
+_TOKEN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how i in is it my of on or should the this to what when which with you your"
+    .split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    kind = "bm25"
+
+    def __init__(self, terms: List[str], offsets: np.ndarray, postings: np.ndarray, frequencies: np.ndarray,
+                 lengths: np.ndarray, ids: List[str], documents: List[str], metadatas: List[dict],
+                 k1: float = 1.2, b: float = 0.75):
+        self.terms = terms
+        self.term_ids: Dict[str, int] = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.k1 = k1
+        # per-document part of the BM25 denominator, k1 * (1 - b + b * len / avg_len)
+        average = float(lengths.mean()) if len(lengths) else 1.0
+        self._length_norm = (k1 * (1 - b + b * np.asarray(lengths, dtype=np.float32) / max(average, 1.0))
+                             ).astype(np.float32)
+
+    @classmethod
+    def build(cls, ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[dict], **kwargs) -> "BM25Index":
+        term_ids: Dict[str, int] = {}
+        term_column, doc_column, tf_column = [], [], []
+        lengths = np.zeros(len(documents), dtype=np.uint32)
+        for row, document in enumerate(documents):
+            tokens = tokenize(document or "")
+            lengths[row] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_column.append(term_ids.setdefault(term, len(term_ids)))
+                doc_column.append(row)
+                tf_column.append(min(tf, 65535))
+
+        term_column = np.asarray(term_column, dtype=np.int64)
+        order = np.argsort(term_column, kind="stable")  # rows were appended in ascending order
+        offsets = np.zeros(len(term_ids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(term_column, minlength=len(term_ids)))
+        return cls(
+            list(term_ids),
+            offsets,
+            np.asarray(doc_column, dtype=np.uint32)[order],
+            np.asarray(tf_column, dtype=np.uint16)[order],
+            lengths,
+            list(ids), list(documents), list(metadatas),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.offsets.nbytes + self.postings.nbytes + self.frequencies.nbytes + self.lengths.nbytes)
+
+    def describe(self) -> dict:
+        return {"kind": self.kind, "documents": len(self), "terms": len(self.terms), "bytes": self.nbytes}
+
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(row indices, BM25 scores) of the best k documents containing any query term."""
+        scores = np.zeros(len(self), dtype=np.float32)
+        n = len(self)
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows = self.postings[start:end]
+            tf = self.frequencies[start:end].astype(np.float32)
+            idf = np.log1p((n - (end - start) + 0.5) / ((end - start) + 0.5))
+            scores[rows] += idf * tf * (self.k1 + 1) / (tf + self._length_norm[rows])
+        matched = np.flatnonzero(scores)
+        top = matched[_top_k(scores[matched], k)]
+        return top, scores[top]
+
+    # ---- persistence ----
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        for name in ("offsets", "postings", "frequencies", "lengths"):
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump(self.terms, f)
+        with open(os.path.join(directory, "records.json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "documents": self.documents, "metadatas": self.metadatas}, f)
+        with open(os.path.join(directory, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({"kind": self.kind, "documents": len(self), "terms": len(self.terms)}, f)
+
+    @classmethod
+    def load(cls, directory: str, **kwargs) -> "BM25Index":
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                  for name in ("offsets", "postings", "frequencies", "lengths")}
+        with open(os.path.join(directory, "terms.json"), "r", encoding="utf-8") as f:
+            terms = json.load(f)
+        with open(os.path.join(directory, "records.json"), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        return cls(terms, ids=records["ids"], documents=records["documents"], metadatas=records["metadatas"],
+                   **arrays)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists: score(id) = sum over lists of 1 / (k + rank), rank starting at 1."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
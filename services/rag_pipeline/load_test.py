@@ -0,0 +1,261 @@
+"""Load test for /query, /chat and /chat/stream.
+
+By default the app runs in-process (uvicorn on 127.0.0.1) against stub
+backends: a fake genai client whose embed/generate calls just sleep for the
+configured latency, and a fake async Chroma client. This measures what the
+service itself sustains (event loop, handlers, caches) without GCP or a
+Chroma server. Pass --url to load a running service instead.
+
+    python load_test.py --endpoint chat --requests 2000 --concurrency 300
+    python load_test.py --url http://localhost:8002 --endpoint query
+    python load_test.py --endpoint chat-stream   # also reports time to first token
+    python load_test.py --endpoint query/batch --batch-size 100 --requests 20 --concurrency 2
+
+The response cache is disabled and every request uses a distinct query so
+each one goes through embedding, retrieval and (for chat) generation.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+import numpy as np
+import uvicorn
+
+
+# ----------------------------
+# Stub backends
+# ----------------------------
+STREAM_CHUNKS = 20
+
+def _fake_vector(text: str, dim: int = 256) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], "little")
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32).tolist()
+
+
+class StubGenAIModels:
+    def __init__(self, embed_latency: float, llm_latency: float):
+        self.embed_latency = embed_latency
+        self.llm_latency = llm_latency
+
+    async def embed_content(self, model, contents, config=None):
+        await asyncio.sleep(self.embed_latency)
+        texts = [contents] if isinstance(contents, str) else contents
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=_fake_vector(t)) for t in texts])
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self.llm_latency)
+        return SimpleNamespace(text="Stub answer based on the retrieved chunks.")
+
+    async def generate_content_stream(self, model, contents, config=None):
+        """The generation latency is spread evenly over STREAM_CHUNKS chunks."""
+        async def stream():
+            for i in range(STREAM_CHUNKS):
+                await asyncio.sleep(self.llm_latency / STREAM_CHUNKS)
+                yield SimpleNamespace(text=f"stub token {i} ")
+        return stream()
+
+
+class StubSyncGenAIModels:
+    """Sync embedding surface, used by generate_text_embeddings (e.g. /query/batch)."""
+
+    def __init__(self, embed_latency: float):
+        self.embed_latency = embed_latency
+
+    def embed_content(self, model, contents, config=None):
+        time.sleep(self.embed_latency)
+        texts = [contents] if isinstance(contents, str) else contents
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=_fake_vector(t)) for t in texts])
+
+
+class StubGenAIClient:
+    """Stands in for google.genai.Client."""
+
+    embed_latency = 0.05
+    llm_latency = 0.5
+
+    def __init__(self, *args, **kwargs):
+        self.models = StubSyncGenAIModels(self.embed_latency)
+        self.aio = SimpleNamespace(models=StubGenAIModels(self.embed_latency, self.llm_latency))
+
+
+class StubCollection:
+    def __init__(self, name: str, latency: float):
+        self.name = name
+        self.id = name
+        self.latency = latency
+
+    async def query(self, query_embeddings, n_results=10, **kwargs):
+        await asyncio.sleep(self.latency)
+        n = len(query_embeddings)
+        return {
+            "ids": [[f"stub-{i}" for i in range(n_results)] for _ in range(n)],
+            "documents": [[f"Stub chunk {i} about training and nutrition." for i in range(n_results)]
+                          for _ in range(n)],
+            "metadatas": [[{"source": "stub"} for _ in range(n_results)] for _ in range(n)],
+            "distances": [[0.1 + 0.01 * i for i in range(n_results)] for _ in range(n)],
+        }
+
+
+class StubAsyncChromaClient:
+    latency = 0.02
+
+    async def get_collection(self, name):
+        await asyncio.sleep(self.latency)
+        return StubCollection(name, self.latency)
+
+    async def heartbeat(self):
+        return time.time_ns()
+
+    async def list_collections(self):
+        return []
+
+
+async def _stub_async_http_client(*args, **kwargs):
+    return StubAsyncChromaClient()
+
+
+def load_app_with_stubs(embed_latency: float, llm_latency: float, chroma_latency: float):
+    """Import the app with the GCP and Chroma clients replaced by stubs."""
+    os.environ.setdefault("GCP_PROJECT", "load-test")
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+    os.environ["QUERY_CACHE_MAX_ENTRIES"] = "0"
+    StubGenAIClient.embed_latency = embed_latency
+    StubGenAIClient.llm_latency = llm_latency
+    StubAsyncChromaClient.latency = chroma_latency
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    with mock.patch("google.cloud.storage.Client"), mock.patch("google.genai.Client", StubGenAIClient):
+        import app as rag_app
+    mock.patch("chromadb.AsyncHttpClient", _stub_async_http_client).start()
+    return rag_app.app
+
+
+# ----------------------------
+# Load generator
+# ----------------------------
+async def run_load(clients: list, endpoint: str, total: int, concurrency: int,
+                   method: str, n_results: int, batch_size: int = 1) -> dict:
+    if endpoint != "query/batch":
+        batch_size = 1
+    latencies, first_token_latencies, errors = [], [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_stream(client: httpx.AsyncClient, payload: dict, start: float) -> bool:
+        """Read the SSE stream; record the time to the first token event."""
+        async with client.stream("POST", "/chat/stream", json=payload) as response:
+            if response.status_code != 200:
+                return False
+            first_token = True
+            async for line in response.aiter_lines():
+                if line == "event: token" and first_token:
+                    first_token_latencies.append(time.perf_counter() - start)
+                    first_token = False
+                elif line == "event: error":
+                    return False
+            return True
+
+    async def one(i: int):
+        nonlocal errors
+        payload = {"query": f"How should I progress my squat? variant {i}", "method": method,
+                   "n_results": n_results}
+        if endpoint == "query/batch":
+            query = payload.pop("query")
+            payload["queries"] = [f"{query} / {j}" for j in range(batch_size)]
+        client = clients[i % len(clients)]
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                if endpoint == "chat-stream":
+                    ok = await one_stream(client, payload, start)
+                else:
+                    response = await client.post(f"/{endpoint}", json=payload)
+                    ok = response.status_code == 200
+                if not ok:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    wall = time.perf_counter() - start
+
+    def percentiles(values) -> dict:
+        values_ms = np.array(values) * 1000
+        return {
+            "p50": round(float(np.percentile(values_ms, 50)), 1),
+            "p95": round(float(np.percentile(values_ms, 95)), 1),
+            "p99": round(float(np.percentile(values_ms, 99)), 1),
+            "max": round(float(values_ms.max()), 1),
+        }
+
+    result = {
+        "endpoint": endpoint,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(total / wall, 1),
+        "queries_per_second": round(total * batch_size / wall, 1),
+        "latency_ms": percentiles(latencies),
+    }
+    if first_token_latencies:
+        result["first_token_ms"] = percentiles(first_token_latencies)
+    return result
+
+
+async def main(args):
+    server = None
+    if args.url:
+        base_url = args.url
+    else:
+        # Real HTTP server on this event loop (ASGITransport would buffer the SSE stream)
+        app = load_app_with_stubs(args.embed_latency, args.llm_latency, args.chroma_latency)
+        server = uvicorn.Server(uvicorn.Config(
+            app, host="127.0.0.1", port=args.port, log_level="warning", backlog=4096))
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    # httpx scans its whole connection pool on every request, so a single pool
+    # of hundreds of connections would make the load generator the bottleneck
+    pool_size = 8
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    clients = [httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120)
+               for _ in range(-(-args.concurrency // pool_size))]
+    try:
+        # warm-up: client creation, collection handle
+        await run_load(clients[:1], args.endpoint, min(10, args.requests), 1, args.method, args.n_results)
+        result = await run_load(clients, args.endpoint, args.requests, args.concurrency,
+                                args.method, args.n_results, args.batch_size)
+    finally:
+        for client in clients:
+            await client.aclose()
+        if server is not None:
+            server.should_exit = True
+            await server_task
+    print(result)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the RAG service /query, /chat and /chat/stream endpoints")
+    parser.add_argument("--url", help="base URL of a running service (default: in-process app with stub backends)")
+    parser.add_argument("--endpoint", choices=["query", "query/batch", "chat", "chat-stream"], default="chat")
+    parser.add_argument("--batch-size", type=int, default=100, help="queries per /query/batch request")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8765, help="port of the in-process stub server")
+    parser.add_argument("--method", default="char-split")
+    parser.add_argument("--n-results", type=int, default=10)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="stub embedding latency (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="stub generation latency (s)")
+    parser.add_argument("--chroma-latency", type=float, default=0.02, help="stub Chroma latency (s)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,160 @@
+"""Two-level response cache for /query and /chat.
+
+* Exact level: keyed on ``(kind, method, n_results, normalized query)``.
+* Semantic level: a new query whose embedding lies within ``max_distance``
+  (cosine distance) of a cached query with the same kind/method/n_results
+  reuses that query's response.
+
+Entries expire after ``ttl_seconds`` and the least recently used ones are
+evicted beyond ``max_entries``. ``invalidate(method)`` drops everything
+cached for a collection when it is re-indexed; callers pass the
+``generation(method)`` they read before computing a response to ``put`` so a
+response computed against the old index is never stored after invalidation.
+"""
+
+import copy
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Casefold, NFKC-normalize, collapse whitespace and strip trailing punctuation."""
+    query = unicodedata.normalize("NFKC", query).casefold()
+    query = _WHITESPACE.sub(" ", query).strip()
+    return query.rstrip(" ?!.。？！")
+
+
+class _Entry:
+    __slots__ = ("query", "value", "vector", "created_at")
+
+    def __init__(self, query: str, value: Any, vector: Optional[np.ndarray]):
+        self.query = query
+        self.value = value
+        self.vector = vector
+        self.created_at = time.monotonic()
+
+
+class QueryResultCache:
+    """Thread-safe exact + semantic LRU/TTL cache of API responses."""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600, max_distance: float = 0.05):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self._entries: "OrderedDict[Tuple[str, str, int, str], _Entry]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0,
+                          "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry.created_at > self.ttl_seconds
+
+    def generation(self, method: str) -> int:
+        with self._lock:
+            return self._generations.get(method, 0)
+
+    def get_exact(self, kind: str, method: str, n_results: int, query: str) -> Optional[Any]:
+        """Return a copy of the cached response for this exact (normalized) query."""
+        if not self.enabled:
+            return None
+        key = (kind, method, n_results, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, time.monotonic()):
+                del self._entries[key]
+                self._counters["expirations"] += 1
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._counters["exact_hits"] += 1
+            return copy.deepcopy(entry.value)
+
+    def get_semantic(self, kind: str, method: str, n_results: int,
+                     embedding: Sequence[float]) -> Optional[Tuple[Any, str, float]]:
+        """
+        Return ``(response, cached_query, distance)`` of the nearest cached query
+        within ``max_distance``, or None (counted as a miss).
+        """
+        if not self.enabled:
+            return None
+        vector = self._unit(embedding)
+        with self._lock:
+            now = time.monotonic()
+            keys, vectors = [], []
+            for key, entry in list(self._entries.items()):
+                if key[:3] != (kind, method, n_results) or entry.vector is None:
+                    continue
+                if self._expired(entry, now):
+                    del self._entries[key]
+                    self._counters["expirations"] += 1
+                    continue
+                keys.append(key)
+                vectors.append(entry.vector)
+            if vector is not None and vectors and self.max_distance > 0:
+                distances = 1.0 - np.stack(vectors) @ vector
+                best = int(np.argmin(distances))
+                if distances[best] <= self.max_distance:
+                    entry = self._entries[keys[best]]
+                    self._entries.move_to_end(keys[best])
+                    self._counters["semantic_hits"] += 1
+                    return copy.deepcopy(entry.value), entry.query, float(distances[best])
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, kind: str, method: str, n_results: int, query: str,
+            embedding: Optional[Sequence[float]], value: Any, generation: int):
+        """Cache a response unless the collection was re-indexed since ``generation``."""
+        if not self.enabled:
+            return
+        key = (kind, method, n_results, normalize_query(query))
+        entry = _Entry(query, copy.deepcopy(value), self._unit(embedding))
+        with self._lock:
+            if self._generations.get(method, 0) != generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def invalidate(self, method: Optional[str] = None):
+        """Drop cached responses of one collection (all collections if method is None)."""
+        with self._lock:
+            methods = {key[1] for key in self._entries} | set(self._generations)
+            if method is not None:
+                methods = {method}
+            for m in methods:
+                self._generations[m] = self._generations.get(m, 0) + 1
+            for key in [k for k in self._entries if k[1] in methods]:
+                del self._entries[key]
+            self._counters["invalidations"] += 1
+
+    @staticmethod
+    def _unit(embedding: Optional[Sequence[float]]) -> Optional[np.ndarray]:
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0
+        return stats
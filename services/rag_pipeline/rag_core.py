@@ -1,9 +1,11 @@
 import os
+import asyncio
+import numpy as np
 import pandas as pd
 import json
 import time
 import hashlib
-import chromadb
+import threading
 from io import StringIO
 
 # Google Cloud
@@ -17,6 +19,15 @@ from google.cloud import storage
 from langchain.text_splitter import CharacterTextSplitter
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from semantic_splitter import SemanticChunker
+from embedding_cache import EmbeddingCache
+from ingest_pipeline import IngestPipeline, Stage
+from embedding_batcher import AdaptiveRateLimiter, run_batches_concurrently
+from query_cache import QueryResultCache
+from chroma_client import ChromaClientManager, is_collection_missing
+from context_assembly import assemble_context
+from vector_index import INDEX_TYPES, LocalIndexStore, recall_at_k
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from rerank import load_scorer, rerank
 
 # Setup
 GCP_PROJECT = os.environ["GCP_PROJECT"]
@@ -26,6 +37,49 @@ EMBEDDING_DIMENSION = 256
 GENERATIVE_MODEL = "gemini-2.0-flash-001"
 CHROMADB_HOST = os.getenv("CHROMADB_HOST", "chromadb")
 CHROMADB_PORT = int(os.getenv("CHROMADB_PORT", "8000"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "tmp/embedding_cache.sqlite")
+EMBEDDING_CACHE_MEMORY_MB = int(os.getenv("EMBEDDING_CACHE_MEMORY_MB", "64"))
+INDEX_MANIFEST_DIR = os.getenv("INDEX_MANIFEST_DIR", "tmp/manifests")
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_REQUESTS_PER_SECOND = float(os.getenv("EMBEDDING_REQUESTS_PER_SECOND", "10"))
+SEMANTIC_SPLIT_GROUP_SIZE = int(os.getenv("SEMANTIC_SPLIT_GROUP_SIZE", "8"))
+SEMANTIC_SPLIT_PROCESSES = int(os.getenv("SEMANTIC_SPLIT_PROCESSES", "1"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+INGEST_PIPELINE_WORKERS = {
+    "download": int(os.getenv("INGEST_DOWNLOAD_WORKERS", "4")),
+    "split": int(os.getenv("INGEST_SPLIT_WORKERS", "2")),
+    "embed": int(os.getenv("INGEST_EMBED_WORKERS", "2")),
+    "upsert": int(os.getenv("INGEST_UPSERT_WORKERS", "1")),
+}
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1000"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+QUERY_CACHE_MAX_DISTANCE = float(os.getenv("QUERY_CACHE_MAX_DISTANCE", "0.05"))
+QUERY_BATCH_MAX_QUERIES = int(os.getenv("QUERY_BATCH_MAX_QUERIES", "1000"))
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "2000"))
+CHAT_CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CHAT_CONTEXT_DEDUP_THRESHOLD", "0.8"))
+# 每个method的检索后端: chroma（默认）、exact（进程内精确检索）或 ivf（进程内IVF近似检索），如 "char-split=exact,semantic-split=ivf"
+RETRIEVAL_BACKENDS = dict(
+    item.split("=", 1) for item in os.getenv("RETRIEVAL_BACKENDS", "").replace(" ", "").split(",") if item)
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "tmp/local_index")
+LOCAL_INDEX_NLIST = int(os.getenv("LOCAL_INDEX_NLIST", "0"))
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "8"))
+# 进程内索引的向量存储: float32，或 int8（每个向量一个scale，内存为float32的1/4）
+LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "float32")
+# int8索引: 每个结果取 k*LOCAL_INDEX_RESCORE 个候选用float32原始向量重新打分（0 = 不重打分，也不保存float32副本）
+LOCAL_INDEX_RESCORE = int(os.getenv("LOCAL_INDEX_RESCORE", "4"))
+# BM25倒排索引（每次ingest后重建），用于 retrieval=lexical/hybrid
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "tmp/lexical_index")
+# hybrid: 向量和BM25各取 n_results*HYBRID_CANDIDATES 个候选，用RRF(k=HYBRID_RRF_K)融合
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "2"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+# /chat rerank: 先取 CHAT_RERANK_CANDIDATES 个候选，用本地scorer重新打分（时间预算 CHAT_RERANK_BUDGET_MS），
+# 只把前 CHAT_RERANK_TOP_N 个（不超过n_results）交给Gemini; 默认0（关闭，/chat 使用全部n_results个chunk）
+CHAT_RERANK_CANDIDATES = int(os.getenv("CHAT_RERANK_CANDIDATES", "30"))
+CHAT_RERANK_TOP_N = int(os.getenv("CHAT_RERANK_TOP_N", "0"))
+CHAT_RERANK_BUDGET_MS = float(os.getenv("CHAT_RERANK_BUDGET_MS", "20"))
+# "term-overlap"，或 "module:function" 形式的自定义scorer（例如CPU上的小型cross-encoder）
+CHAT_RERANK_SCORER = os.getenv("CHAT_RERANK_SCORER", "term-overlap")
 
 # Initialize GCS client
 gcs_client = storage.Client(project=GCP_PROJECT)
@@ -34,6 +88,26 @@ gcs_client = storage.Client(project=GCP_PROJECT)
 llm_client = genai.Client(
     vertexai=True, project=GCP_PROJECT, location=GCP_LOCATION)
 
+# 进程内共享的ChromaDB客户端（连接池）和集合句柄缓存
+chroma = ChromaClientManager(CHROMADB_HOST, CHROMADB_PORT)
+
+# 进程内向量索引（内存映射的快照），用于 RETRIEVAL_BACKENDS 中配置为 exact/ivf 的method
+local_indexes = LocalIndexStore(LOCAL_INDEX_DIR, nprobe=LOCAL_INDEX_NPROBE, rescore=LOCAL_INDEX_RESCORE)
+lexical_indexes = LocalIndexStore(LEXICAL_INDEX_DIR, index_types={BM25Index.kind: BM25Index})
+
+# Embedding cache (memory LRU + SQLite), empty path disables the disk tier
+embedding_cache = EmbeddingCache(
+    EMBEDDING_CACHE_PATH or None, max_memory_bytes=EMBEDDING_CACHE_MEMORY_MB * 1024 * 1024)
+
+# Shared adaptive rate limiter for all embedding requests
+embedding_rate_limiter = AdaptiveRateLimiter(rate=EMBEDDING_REQUESTS_PER_SECOND)
+
+# /query 和 /chat 的响应缓存（精确 + 语义近似命中），重新索引时按method失效
+query_cache = QueryResultCache(
+    max_entries=QUERY_CACHE_MAX_ENTRIES,
+    ttl_seconds=QUERY_CACHE_TTL_SECONDS,
+    max_distance=QUERY_CACHE_MAX_DISTANCE)
+
 # System instruction for fitness knowledge
 SYSTEM_INSTRUCTION = """
 You are an AI assistant specialized in fitness and nutrition knowledge. Your responses are based solely on the information provided in the text chunks given to you. Do not use any external knowledge or make assumptions beyond what is explicitly stated in these chunks.
@@ -55,6 +129,9 @@ Remember:
 Your goal is to provide accurate, helpful information about fitness and nutrition based solely on the content of the text chunks you receive with each query.
 """
 
+# 系统指令通过 system_instruction 配置传入（不再拼进每个prompt），前缀固定便于模型端缓存
+CHAT_GENERATION_CONFIG = types.GenerateContentConfig(system_instruction=SYSTEM_INSTRUCTION)
+
 # GCS Helper functions
 def download_text_from_gcs(bucket_name: str, file_path: str) -> str:
     """从GCS下载文本文件内容"""
@@ -78,7 +155,9 @@ def list_txt_files_from_gcs(bucket_name: str, folder_path: str = "") -> list:
                 txt_files.append({
                     "name": blob.name,
                     "bucket": bucket_name,
-                    "size": blob.size
+                    "size": blob.size,
+                    "generation": blob.generation,
+                    "md5": blob.md5_hash
                 })
         
         return txt_files
@@ -86,46 +165,273 @@ def list_txt_files_from_gcs(bucket_name: str, folder_path: str = "") -> list:
         raise Exception(f"Failed to list files from GCS: {str(e)}")
 
 # Helper functions
-def generate_query_embedding(query):
+async def generate_query_embedding(query):
+    # 缓存读写走SQLite并与ingest线程共用一把锁，放到工作线程中，避免阻塞事件循环
+    cached = await asyncio.to_thread(embedding_cache.get, EMBEDDING_MODEL, EMBEDDING_DIMENSION, query)
+    if cached is not None:
+        return cached.tolist()
+
     kwargs = {
         "output_dimensionality": EMBEDDING_DIMENSION
     }
-    response = llm_client.models.embed_content(
+    response = await llm_client.aio.models.embed_content(
         model=EMBEDDING_MODEL,
         contents=query,
         config=types.EmbedContentConfig(**kwargs)
     )
-    return response.embeddings[0].values
-
-def generate_text_embeddings(chunks, dimensionality: int = 256, batch_size=250, max_retries=5, retry_delay=5):
-    all_embeddings = []
-    for i in range(0, len(chunks), batch_size):
-        batch = chunks[i:i+batch_size]
-        retry_count = 0
-        while retry_count <= max_retries:
-            try:
-                response = llm_client.models.embed_content(
-                    model=EMBEDDING_MODEL,
-                    contents=batch,
-                    config=types.EmbedContentConfig(
-                        output_dimensionality=dimensionality),
-                )
-                all_embeddings.extend(
-                    [embedding.values for embedding in response.embeddings])
-                break
-            except errors.APIError as e:
-                retry_count += 1
-                if retry_count > max_retries:
-                    raise Exception(f"Failed to generate embeddings after {max_retries} attempts: {str(e)}")
-                wait_time = retry_delay * (2 ** (retry_count - 1))
-                time.sleep(wait_time)
-    return all_embeddings
-
-def load_text_embeddings(df, collection, batch_size=500):
-    df["id"] = df.index.astype(str)
-    hashed_sources = df["source"].apply(
-        lambda x: hashlib.sha256(x.encode()).hexdigest()[:16])
-    df["id"] = hashed_sources + "-" + df["id"]
+    embedding = response.embeddings[0].values
+    await asyncio.to_thread(embedding_cache.put, EMBEDDING_MODEL, EMBEDDING_DIMENSION, query, embedding)
+    return embedding
+
+def _embed_batch(batch, dimensionality: int):
+    response = llm_client.models.embed_content(
+        model=EMBEDDING_MODEL,
+        contents=batch,
+        config=types.EmbedContentConfig(
+            output_dimensionality=dimensionality),
+    )
+    return [embedding.values for embedding in response.embeddings]
+
+def generate_text_embeddings(chunks, dimensionality: int = 256, batch_size=250, max_retries=5, retry_delay=5,
+                             concurrency: int = None, embed_fn=None, as_array: bool = False):
+    """批量生成嵌入: 先查缓存，未命中的文本按batch并发发送给Vertex（共享自适应限流），输出顺序与输入一致
+
+    embed_fn(batch, dimensionality) 可替换真实的Vertex调用（例如测试用的fake embedder）。
+    as_array=True 时返回一个 (len(chunks), dimensionality) 的float32矩阵，而不是Python float列表
+    （ingest路径用它，每个向量1KB而不是约8KB的Python对象）。
+    """
+    # 先查缓存，只把未命中的文本发送给Vertex
+    cached = embedding_cache.get_many(EMBEDDING_MODEL, dimensionality, chunks)
+    all_embeddings = np.zeros((len(chunks), dimensionality), dtype=np.float32)
+    miss_positions = {}
+    for i, embedding in enumerate(cached):
+        if embedding is None:
+            miss_positions.setdefault(chunks[i], []).append(i)
+        else:
+            all_embeddings[i] = embedding
+    misses = list(miss_positions.keys())
+    if not misses:
+        return all_embeddings if as_array else all_embeddings.tolist()
+
+    embed_fn = embed_fn or _embed_batch
+    batches = [misses[i:i+batch_size] for i in range(0, len(misses), batch_size)]
+
+    def embed_and_cache(batch):
+        batch_embeddings = np.asarray(embed_fn(batch, dimensionality), dtype=np.float32)
+        embedding_cache.put_many(EMBEDDING_MODEL, dimensionality, batch, batch_embeddings)
+        return batch_embeddings
+
+    batch_results = run_batches_concurrently(
+        batches,
+        embed_and_cache,
+        max_workers=concurrency or EMBEDDING_CONCURRENCY,
+        limiter=embedding_rate_limiter,
+        max_retries=max_retries,
+        retry_delay=retry_delay,
+        retryable=(errors.APIError,),
+    )
+    for batch, batch_embeddings in zip(batches, batch_results):
+        for text, embedding in zip(batch, batch_embeddings):
+            for position in miss_positions[text]:
+                all_embeddings[position] = embedding
+    return all_embeddings if as_array else all_embeddings.tolist()
+
+def _cached_response(response: dict, query: str, level: str, matched_query: str = None,
+                     distance: float = None) -> dict:
+    """把缓存的响应改写为当前query的响应，并注明命中的缓存层级"""
+    response["query"] = query
+    response["cache"] = {"level": level}
+    if level == "semantic":
+        response["cache"].update({"matched_query": matched_query, "distance": distance})
+    return response
+
+def retrieval_backend(method: str) -> str:
+    return RETRIEVAL_BACKENDS.get(method, "chroma")
+
+async def query_collection(method: str, query_embeddings: list, n_results: int) -> dict:
+    """检索 {method}-collection: 配置了进程内索引且已有快照时直接在内存中检索，否则用缓存的异步集合句柄查询Chroma"""
+    if retrieval_backend(method) != "chroma":
+        results = local_indexes.search(method, query_embeddings, n_results)
+        if results is not None:
+            return results
+    collection_name = f"{method}-collection"
+    try:
+        return await chroma.awith_collection(
+            collection_name,
+            lambda collection: collection.query(query_embeddings=query_embeddings, n_results=n_results))
+    except Exception as e:
+        if is_collection_missing(e):
+            raise Exception(f"Collection '{collection_name}' not found. Please run /load first.")
+        raise
+
+
+def lexical_search(method: str, query: str, n_results: int) -> dict:
+    """BM25检索 {method} 的倒排索引，返回与Chroma相同结构的结果（distances为None，scores为BM25分数）"""
+    index = lexical_indexes.get(method)
+    if index is None:
+        raise Exception(f"No lexical index for '{method}' yet; run /process-gcs or POST /local-index/{method}/refresh")
+    rows, scores = index.search(query, n_results)
+    return {
+        "ids": [[index.ids[i] for i in rows]],
+        "documents": [[index.documents[i] for i in rows]],
+        "metadatas": [[index.metadatas[i] for i in rows]],
+        "distances": [[None] * len(rows)],
+        "scores": [scores.tolist()],
+    }
+
+def fuse_results(vector_results: dict, lexical_results: dict, n_results: int) -> dict:
+    """用reciprocal-rank fusion合并向量和BM25结果; 每个结果带上它在两个列表中的名次（未出现为None）"""
+    vector_ids, lexical_ids = vector_results["ids"][0], lexical_results["ids"][0]
+    fused = reciprocal_rank_fusion([vector_ids, lexical_ids], k=HYBRID_RRF_K)[:n_results]
+    vector_rank = {chunk_id: rank for rank, chunk_id in enumerate(vector_ids, start=1)}
+    lexical_rank = {chunk_id: rank for rank, chunk_id in enumerate(lexical_ids, start=1)}
+    
+    def field(name, chunk_id):
+        if chunk_id in vector_rank:
+            return vector_results[name][0][vector_rank[chunk_id] - 1]
+        return lexical_results[name][0][lexical_rank[chunk_id] - 1]
+    
+    return {
+        "ids": [[chunk_id for chunk_id, _ in fused]],
+        "documents": [[field("documents", chunk_id) for chunk_id, _ in fused]],
+        "metadatas": [[field("metadatas", chunk_id) for chunk_id, _ in fused]],
+        "distances": [[vector_results["distances"][0][vector_rank[chunk_id] - 1] if chunk_id in vector_rank else None
+                       for chunk_id, _ in fused]],
+        "scores": [[score for _, score in fused]],
+        "vector_ranks": [[vector_rank.get(chunk_id) for chunk_id, _ in fused]],
+        "lexical_ranks": [[lexical_rank.get(chunk_id) for chunk_id, _ in fused]],
+    }
+
+# 检索结果中每个chunk一项的字段（Chroma的结果还带有 "included" 等其他键）
+RESULT_FIELDS = ("ids", "documents", "metadatas", "distances", "scores", "vector_ranks", "lexical_ranks")
+
+def _cache_kind(kind: str, retrieval: str) -> str:
+    """不同检索模式的响应分开缓存"""
+    return kind if retrieval == "vector" else f"{kind}:{retrieval}"
+
+async def retrieve(kind: str, query: str, method: str, n_results: int, retrieval: str = "vector",
+                   fetch: int = None) -> tuple:
+    """按检索模式取回 fetch（默认n_results）个chunk，返回 (results, query_embedding, semantic_hit, retrieval)
+
+    - vector: query嵌入 + 向量检索
+    - lexical: 只查BM25倒排索引，不调用嵌入模型
+    - hybrid: BM25检索在工作线程中与嵌入请求同时进行，再与向量结果做RRF融合；
+      该method还没有BM25索引时退回vector
+    semantic_hit 不为None时表示命中了语义缓存，此时不做检索（results为None）。
+    返回的 retrieval 是实际使用的检索模式，响应和缓存都按它记录。
+    """
+    if retrieval not in RETRIEVAL_MODES:
+        raise Exception(f"Unknown retrieval mode '{retrieval}', expected one of {RETRIEVAL_MODES}")
+    fetch = fetch or n_results
+    if retrieval == "lexical":
+        return lexical_search(method, query, fetch), None, None, retrieval
+    if retrieval == "hybrid" and lexical_indexes.get(method) is None:
+        retrieval = "vector"  # 下次 /process-gcs 或手动refresh之后才有BM25索引，先只用向量检索
+    
+    candidates = fetch * HYBRID_CANDIDATES if retrieval == "hybrid" else fetch
+    if retrieval == "hybrid":
+        query_embedding, lexical_results = await asyncio.gather(
+            generate_query_embedding(query), asyncio.to_thread(lexical_search, method, query, candidates))
+    else:
+        query_embedding = await generate_query_embedding(query)
+    
+    hit = query_cache.get_semantic(_cache_kind(kind, retrieval), method, n_results, query_embedding)
+    if hit is not None:
+        return None, query_embedding, hit, retrieval
+    
+    # 余弦相似度 (cosine similarity)
+    results = await query_collection(method, [query_embedding], candidates)
+    if retrieval == "hybrid":
+        results = fuse_results(results, lexical_results, fetch)
+    return results, query_embedding, None, retrieval
+
+def _rerank_fetch(n_results: int) -> int:
+    """/chat 检索的候选数（开启rerank时多取）"""
+    return max(n_results, CHAT_RERANK_CANDIDATES) if CHAT_RERANK_TOP_N > 0 else n_results
+
+def rerank_results(query: str, results: dict, n_results: int) -> tuple:
+    """对多取的候选重新打分，只保留前 min(n_results, CHAT_RERANK_TOP_N) 个; 返回 (results, rerank统计)"""
+    if CHAT_RERANK_TOP_N <= 0:
+        return results, None
+    positions, report = rerank(
+        query, results["documents"][0], min(n_results, CHAT_RERANK_TOP_N), load_scorer(CHAT_RERANK_SCORER),
+        time_budget_ms=CHAT_RERANK_BUDGET_MS, baseline_n=n_results)
+    report["scorer"] = CHAT_RERANK_SCORER
+    return {key: [[results[key][0][i] for i in positions]] for key in RESULT_FIELDS
+            if results.get(key) is not None}, report
+
+def refresh_local_index(method: str, collection=None, page_size: int = 5000) -> dict:
+    """从Chroma集合导出全部向量，构建进程内索引快照并原子替换当前快照"""
+    start = time.perf_counter()
+    backend = retrieval_backend(method)
+    if backend not in INDEX_TYPES:
+        raise Exception(f"Retrieval backend for '{method}' is '{backend}', not one of {sorted(INDEX_TYPES)}")
+    collection = collection or chroma.get_collection(f"{method}-collection")
+    
+    ids, documents, metadatas, blocks = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"])
+        blocks.append(np.asarray(page["embeddings"], dtype=np.float32))
+        offset += len(page["ids"])
+    if not ids:
+        raise Exception(f"Collection '{method}-collection' is empty")
+    
+    embeddings = np.concatenate(blocks)
+    index = INDEX_TYPES[backend].build(
+        embeddings, ids, documents, metadatas, nlist=LOCAL_INDEX_NLIST or None, nprobe=LOCAL_INDEX_NPROBE,
+        dtype=LOCAL_INDEX_DTYPE, rescore=LOCAL_INDEX_RESCORE)
+    result = {"backend": backend, "dtype": index.dtype, "vectors": len(index), "bytes": index.nbytes}
+    # 近似索引（ivf或int8）: 用抽样的已存向量作query，测量相对float32精确检索的recall@10
+    if backend != "exact" or index.dtype != "float32":
+        sample = np.random.default_rng(0).choice(len(ids), size=min(len(ids), 200), replace=False)
+        result["recall_at_10"] = recall_at_k(index, embeddings, ids, embeddings[sample], k=10)
+    result["version"] = local_indexes.publish(method, index)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def refresh_lexical_index(method: str, collection=None, page_size: int = 5000) -> dict:
+    """从Chroma集合导出全部chunk（同样的chunk id），构建BM25倒排索引快照并原子替换当前快照"""
+    start = time.perf_counter()
+    collection = collection or chroma.get_collection(f"{method}-collection")
+    ids, documents, metadatas = [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"])
+        offset += len(page["ids"])
+    
+    index = BM25Index.build(ids, documents, metadatas)
+    result = index.describe()
+    result["version"] = lexical_indexes.publish(method, index)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def chunk_id_prefix(manifest_key: str) -> str:
+    """来源的chunk id前缀: sha256(gs://bucket/path)[:16]，不同目录下的同名文件不会冲突"""
+    return hashlib.sha256(manifest_key.encode()).hexdigest()[:16]
+
+def _entry_id_prefix(entry: dict) -> str:
+    # 旧清单条目没有id_prefix，其chunk id按文件名(不含扩展名)生成
+    return entry.get("id_prefix") or hashlib.sha256(entry["source"].encode()).hexdigest()[:16]
+
+def chunk_ids_for_source(id_prefix: str, chunks_count: int) -> list:
+    """生成某个来源的全部chunk id: {id_prefix}-{i}"""
+    return [f"{id_prefix}-{i}" for i in range(chunks_count)]
+
+def load_text_embeddings(df, embeddings, collection, batch_size=500):
+    """按batch upsert到Chroma; embeddings 是与df行对应的float32矩阵（不放进DataFrame）"""
+    # id = id_prefix + "-" + 该来源内的chunk序号，保证同一来源的id在重建之间稳定
+    df["id"] = df["id_prefix"] + "-" + df.groupby("id_prefix").cumcount().astype(str)
     
     total_inserted = 0
     for i in range(0, df.shape[0], batch_size):
@@ -133,20 +439,88 @@ def load_text_embeddings(df, collection, batch_size=500):
         ids = batch["id"].tolist()
         documents = batch["chunk"].tolist()
         metadatas = [{"source": s} for s in batch["source"].tolist()]
-        embeddings = batch["embedding"].tolist()
         
-        collection.add(
+        collection.upsert(
             ids=ids,
             documents=documents,
             metadatas=metadatas,
-            embeddings=embeddings
+            embeddings=embeddings[i:i+batch_size]
         )
         total_inserted += len(batch)
     return total_inserted
 
+# Index manifest helpers
+def _manifest_path(collection_name: str) -> str:
+    return os.path.join(INDEX_MANIFEST_DIR, f"{collection_name}.manifest")
+
+def load_index_manifest(collection_name: str) -> dict:
+    """读取集合的索引清单: {gs://bucket/path: {source, id_prefix, generation, md5, chunks_count}}"""
+    path = _manifest_path(collection_name)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_index_manifest(collection_name: str, manifest: dict):
+    """原子写入索引清单"""
+    os.makedirs(INDEX_MANIFEST_DIR, exist_ok=True)
+    path = _manifest_path(collection_name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+def _manifest_key(bucket_name: str, file_path: str) -> str:
+    return f"gs://{bucket_name}/{file_path}"
+
+def split_text_chunks(input_text: str, method: str):
+    """按照method对文本分块，未知method返回None"""
+    text_chunks = None
+    if method == "char-split":
+        chunk_size = 350
+        chunk_overlap = 20
+        text_splitter = CharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, separator='', strip_whitespace=False)
+        text_chunks = text_splitter.create_documents([input_text])
+        text_chunks = [doc.page_content for doc in text_chunks]
+        
+    elif method == "recursive-split":
+        chunk_size = 350
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size)
+        text_chunks = text_splitter.create_documents([input_text])
+        text_chunks = [doc.page_content for doc in text_chunks]
+        
+    elif method == "semantic-split":
+        text_splitter = SemanticChunker(embedding_function=generate_text_embeddings)
+        text_chunks = text_splitter.create_documents([input_text])
+        text_chunks = [doc.page_content for doc in text_chunks]
+    return text_chunks
+
+def make_semantic_chunker() -> SemanticChunker:
+    """批量分块用的SemanticChunker；进程池在首次使用时创建并复用，用完需 close()"""
+    return SemanticChunker(embedding_function=generate_text_embeddings, n_jobs=SEMANTIC_SPLIT_PROCESSES)
+
+def split_texts_chunks(input_texts: list, method: str, semantic_chunker: SemanticChunker = None) -> list:
+    """批量分块，返回每个文本的chunk列表；semantic-split 会合并多个文本的嵌入请求
+
+    传入 semantic_chunker 时复用它（及其进程池），否则本次调用临时创建一个
+    """
+    if method == "semantic-split":
+        if semantic_chunker is not None:
+            return semantic_chunker.split_texts(input_texts)
+        with make_semantic_chunker() as text_splitter:
+            return text_splitter.split_texts(input_texts)
+    return [split_text_chunks(input_text, method) for input_text in input_texts]
+
 # API功能函数
-def api_process_gcs_to_chromadb(bucket_name: str, folder_path: str = "", method: str = "char-split"):
-    """一键处理：从GCS下载文件 -> 分块 -> 生成嵌入 -> 存储到ChromaDB"""
+def api_process_gcs_to_chromadb(bucket_name: str, folder_path: str = "", method: str = "char-split",
+                                incremental: bool = False, pipeline_workers: dict = None):
+    """一键处理：从GCS下载文件 -> 分块 -> 生成嵌入 -> 存储到ChromaDB
+
+    下载、分块、嵌入、写入ChromaDB 作为并发的流水线阶段运行（有界队列，带背压），
+    内存占用与bucket大小无关。pipeline_workers 可覆盖各阶段的worker数量。
+    incremental=True 时只处理新增/修改的文件，并删除已移除文件的chunk，集合在处理期间保持可用。
+    """
     try:
         # 从GCS获取txt文件列表
         txt_files = list_txt_files_from_gcs(bucket_name, folder_path)
@@ -154,193 +528,520 @@ def api_process_gcs_to_chromadb(bucket_name: str, folder_path: str = "", method:
         if not txt_files:
             raise Exception(f"No txt files found in GCS bucket '{bucket_name}' with prefix '{folder_path}'")
         
+        # 连接ChromaDB
+        client = chroma.client
+        
+        collection_name = f"{method}-collection"
+        
+        # 增量模式: 对比清单找出新增/修改/删除的来源
+        collection = None
+        manifest = {}
+        if incremental:
+            try:
+                collection = chroma.get_collection(collection_name)
+                manifest = load_index_manifest(collection_name)
+                # 清单与集合不一致(例如Chroma数据被清空)时退回全量重建
+                if collection.count() != sum(e["chunks_count"] for e in manifest.values()):
+                    collection = None
+                    manifest = {}
+            except Exception:
+                collection = None
+            incremental = collection is not None
+        
+        if incremental:
+            current_keys = set()
+            files_to_process = []
+            for file_info in txt_files:
+                key = _manifest_key(bucket_name, file_info["name"])
+                current_keys.add(key)
+                entry = manifest.get(key)
+                if (entry is None
+                        or entry.get("generation") != file_info["generation"]
+                        or entry.get("md5") != file_info["md5"]):
+                    files_to_process.append(file_info)
+            prefix = _manifest_key(bucket_name, folder_path)
+            removed_keys = [k for k in manifest if k.startswith(prefix) and k not in current_keys]
+        else:
+            files_to_process = txt_files
+            removed_keys = []
+            # 全量模式先写入临时集合，完成后再替换，避免重建期间集合缺失
+            staging_name = f"{collection_name}-staging"
+            try:
+                client.delete_collection(name=staging_name)
+            except Exception:
+                pass  # Collection doesn't exist
+            collection = client.create_collection(
+                name=staging_name, metadata={"hnsw:space": "cosine"})
+        
+        embed_batch_size = 15 if method == "semantic-split" else 100
+        workers = dict(INGEST_PIPELINE_WORKERS)
+        workers.update(pipeline_workers or {})
+        
         processed_files = []
-        all_chunks = []
+        totals = {"chunks": 0, "inserted": 0, "deleted": 0, "embeddings": 0}
+        state_lock = threading.Lock()
+        cache_before = embedding_cache.stats()
+        
+        # 流水线各阶段: 每个item是一组文件，semantic-split 会合并同组文件的嵌入请求
+        def download_stage(group):
+            return [(order, file_info, download_text_from_gcs(bucket_name, file_info["name"]))
+                    for order, file_info in group]
+        
+        def split_stage(group):
+            chunk_lists = split_texts_chunks([input_text for _, _, input_text in group], method, semantic_chunker)
+            group = [(order, file_info, text_chunks)
+                     for (order, file_info, _), text_chunks in zip(group, chunk_lists)
+                     if text_chunks is not None]
+            return group or None
+        
+        def embed_stage(group):
+            chunks_text = [chunk for _, _, text_chunks in group for chunk in text_chunks]
+            embeddings = generate_text_embeddings(chunks_text, EMBEDDING_DIMENSION, batch_size=embed_batch_size,
+                                                  as_array=True)
+            result = []
+            offset = 0
+            for order, file_info, text_chunks in group:
+                result.append((order, file_info, text_chunks, embeddings[offset:offset + len(text_chunks)]))
+                offset += len(text_chunks)
+            return result
         
-        for file_info in txt_files:
+        def upsert_file(item):
+            order, file_info, text_chunks, embeddings = item
             file_path = file_info["name"]
             filename = os.path.basename(file_path)
             source_name = os.path.splitext(filename)[0]
+            key = _manifest_key(bucket_name, file_path)
+            id_prefix = chunk_id_prefix(key)
             
-            # 从GCS下载文件内容
-            input_text = download_text_from_gcs(bucket_name, file_path)
+            # 增量模式: 先删除该来源的旧chunk
+            deleted = 0
+            with state_lock:
+                entry = manifest.pop(key, None)
+            if incremental and entry is not None:
+                stale_ids = chunk_ids_for_source(_entry_id_prefix(entry), entry["chunks_count"])
+                for i in range(0, len(stale_ids), 500):
+                    collection.delete(ids=stale_ids[i:i+500])
+                deleted = len(stale_ids)
             
-            text_chunks = None
-            if method == "char-split":
-                chunk_size = 350
-                chunk_overlap = 20
-                text_splitter = CharacterTextSplitter(
-                    chunk_size=chunk_size, chunk_overlap=chunk_overlap, separator='', strip_whitespace=False)
-                text_chunks = text_splitter.create_documents([input_text])
-                text_chunks = [doc.page_content for doc in text_chunks]
-                
-            elif method == "recursive-split":
-                chunk_size = 350
-                text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size)
-                text_chunks = text_splitter.create_documents([input_text])
-                text_chunks = [doc.page_content for doc in text_chunks]
-                
-            elif method == "semantic-split":
-                text_splitter = SemanticChunker(embedding_function=generate_text_embeddings)
-                text_chunks = text_splitter.create_documents([input_text])
-                text_chunks = [doc.page_content for doc in text_chunks]
+            inserted = 0
+            if text_chunks:
+                data_df = pd.DataFrame({
+                    "chunk": text_chunks,
+                    "source": source_name,
+                    "id_prefix": id_prefix,
+                    "gcs_path": file_path,
+                    "bucket": bucket_name
+                })
+                inserted = load_text_embeddings(data_df, embeddings, collection)
             
-            if text_chunks is not None:
-                # 添加元数据
-                for chunk in text_chunks:
-                    all_chunks.append({
-                        "chunk": chunk,
-                        "source": source_name,
-                        "gcs_path": file_path,
-                        "bucket": bucket_name
-                    })
-                
-                processed_files.append({
+            with state_lock:
+                manifest[key] = {
+                    "source": source_name,
+                    "id_prefix": id_prefix,
+                    "generation": file_info["generation"],
+                    "md5": file_info["md5"],
+                    "chunks_count": len(text_chunks)
+                }
+                processed_files.append((order, {
                     "filename": filename,
                     "source_name": source_name,
                     "gcs_path": file_path,
                     "chunks_count": len(text_chunks),
-                    "file_size": file_info["size"]
-                })
+                    "file_size": file_info["size"],
+                    "generation": file_info["generation"],
+                    "md5": file_info["md5"]
+                }))
+                totals["chunks"] += len(text_chunks)
+                totals["inserted"] += inserted
+                totals["deleted"] += deleted
+                totals["embeddings"] += len(embeddings)
         
-        # 生成嵌入向量
-        chunks_text = [item["chunk"] for item in all_chunks]
-        
-        if method == "semantic-split":
-            embeddings = generate_text_embeddings(chunks_text, EMBEDDING_DIMENSION, batch_size=15)
-        else:
-            embeddings = generate_text_embeddings(chunks_text, EMBEDDING_DIMENSION, batch_size=100)
+        def upsert_stage(group):
+            for item in group:
+                upsert_file(item)
+            return None
         
-        # 准备数据
-        data_df = pd.DataFrame(all_chunks)
-        data_df["embedding"] = embeddings
+        # 整个导入共用一个SemanticChunker，避免每组文件都重新启动进程池
+        semantic_chunker = make_semantic_chunker() if method == "semantic-split" else None
+        pipeline = IngestPipeline([
+            Stage("download", download_stage, workers["download"]),
+            Stage("split", split_stage, workers["split"]),
+            Stage("embed", embed_stage, workers["embed"]),
+            Stage("upsert", upsert_stage, workers["upsert"]),
+        ], queue_size=INGEST_QUEUE_SIZE)
+        try:
+            indexed_files = list(enumerate(files_to_process))
+            group_size = SEMANTIC_SPLIT_GROUP_SIZE if method == "semantic-split" else 1
+            pipeline_stats = pipeline.run(
+                indexed_files[i:i+group_size] for i in range(0, len(indexed_files), group_size))
+        finally:
+            if semantic_chunker is not None:
+                semantic_chunker.close()
+            # 增量模式下即使中途失败也保存已完成来源的清单
+            if incremental:
+                save_index_manifest(collection_name, manifest)
+                query_cache.invalidate(method)
         
-        # 连接ChromaDB
-        chromadb.api.client.SharedSystemClient.clear_system_cache()
-        client = chromadb.HttpClient(host=CHROMADB_HOST, port=CHROMADB_PORT)
+        cache_after = embedding_cache.stats()
         
-        collection_name = f"{method}-collection"
+        if incremental:
+            # 删除已移除来源的chunk
+            for key in removed_keys:
+                entry = manifest.pop(key)
+                stale_ids = chunk_ids_for_source(_entry_id_prefix(entry), entry["chunks_count"])
+                for i in range(0, len(stale_ids), 500):
+                    collection.delete(ids=stale_ids[i:i+500])
+                totals["deleted"] += len(stale_ids)
+        else:
+            # 用临时集合替换旧集合
+            try:
+                client.delete_collection(name=collection_name)
+            except Exception:
+                pass  # Collection doesn't exist
+            collection.modify(name=collection_name)
+            chroma.invalidate(collection_name)
         
+        # 进程内索引: 集合更新后重建快照（失败时继续使用旧快照）
+        local_index = None
+        if retrieval_backend(method) != "chroma":
+            try:
+                local_index = refresh_local_index(method, collection)
+            except Exception as e:
+                print(f"Local index refresh for {method} failed: {e}")
+                local_index = {"backend": retrieval_backend(method), "error": str(e)}
         try:
-            client.delete_collection(name=collection_name)
-        except Exception:
-            pass  # Collection doesn't exist
-        
-        collection = client.create_collection(
-            name=collection_name, metadata={"hnsw:space": "cosine"})
+            lexical_index = refresh_lexical_index(method, collection)
+        except Exception as e:
+            print(f"Lexical index refresh for {method} failed: {e}")
+            lexical_index = {"error": str(e)}
         
-        # 加载到ChromaDB
-        total_inserted = load_text_embeddings(data_df, collection)
+        save_index_manifest(collection_name, manifest)
+        query_cache.invalidate(method)
+        processed_files = [f for _, f in sorted(processed_files, key=lambda x: x[0])]
         
         return {
             "status": "success",
             "method": method,
+            "mode": "incremental" if incremental else "full",
             "bucket_name": bucket_name,
             "folder_path": folder_path,
             "chunking": {
                 "total_files": len(txt_files),
-                "total_chunks": len(all_chunks),
+                "changed_files": len(files_to_process),
+                "removed_files": len(removed_keys),
+                "total_chunks": totals["chunks"],
                 "processed_files": processed_files
             },
             "embedding": {
                 "collection_name": collection_name,
-                "total_inserted": total_inserted,
-                "embeddings_generated": len(embeddings)
-            }
+                "total_inserted": totals["inserted"],
+                "total_deleted": totals["deleted"] if incremental else None,
+                "embeddings_generated": totals["embeddings"],
+                "cache": {
+                    "hits": cache_after["hits"] - cache_before["hits"],
+                    "misses": cache_after["misses"] - cache_before["misses"]
+                }
+            },
+            "pipeline": pipeline_stats,
+            "local_index": local_index,
+            "lexical_index": lexical_index
         }
     except Exception as e:
         raise Exception(str(e))
 
-def api_query_vector_db(query: str, method: str = "char-split", n_results: int = 5):
+def _query_response(query: str, method: str, retrieval: str, results: dict, row: int = 0) -> dict:
+    """/query 的响应（/query/batch 的每一项相同），两个端点缓存同一种对象"""
+    return {
+        "status": "success",
+        "query": query,
+        "method": method,
+        "retrieval": retrieval,
+        "results": {key: results[key][row] for key in RESULT_FIELDS if results.get(key) is not None}
+    }
+
+async def api_query_vector_db(query: str, method: str = "char-split", n_results: int = 5, retrieval: str = "vector"):
     """API版本的查询功能"""
     try:
-        client = chromadb.HttpClient(host=CHROMADB_HOST, port=CHROMADB_PORT)
-        collection_name = f"{method}-collection"
+        cache_kind = _cache_kind("query", retrieval)
+        cached = query_cache.get_exact(cache_kind, method, n_results, query)
+        if cached is not None:
+            return _cached_response(cached, query, "exact")
+        generation = query_cache.generation(method)
         
-        try:
-            collection = client.get_collection(name=collection_name)
-        except Exception:
-            raise Exception(f"Collection '{collection_name}' not found. Please run /load first.")
+        results, query_embedding, hit, retrieval = await retrieve("query", query, method, n_results, retrieval)
+        if hit is not None:
+            return _cached_response(hit[0], query, "semantic", hit[1], hit[2])
         
-        # 将query 向量化
-        query_embedding = generate_query_embedding(query)
+        response = _query_response(query, method, retrieval, results)
+        query_cache.put(_cache_kind("query", retrieval), method, n_results, query, query_embedding, response, generation)
+        return _cached_response(response, query, "miss")
+    except Exception as e:
+        raise Exception(str(e))
 
-        # 余弦相似度 (cosine similarity)
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results
-        )
+def build_chat_prompt(query: str, results: dict) -> tuple:
+    """去重/合并检索到的chunk并按token预算组装上下文，返回 (prompt, 上下文token统计)"""
+    context_chunks, context_report = assemble_context(
+        results["documents"][0],
+        results["ids"][0],
+        results["metadatas"][0],
+        token_budget=CHAT_CONTEXT_TOKEN_BUDGET,
+        dedup_threshold=CHAT_CONTEXT_DEDUP_THRESHOLD
+    )
+    input_prompt = f"""
+        User question:
+        {query}
+        
+        Context from retrieved text:
+        {context_chunks}
+        """
+    return input_prompt, context_report
+
+def _chat_context(results: dict) -> dict:
+    """检索到的chunk的元数据（不含正文）"""
+    context = {
+        "ids": results["ids"][0],
+        "metadatas": results["metadatas"][0],
+        "distances": results["distances"][0]
+    }
+    for key in ("scores", "vector_ranks", "lexical_ranks"):
+        if key in results:
+            context[key] = results[key][0]
+    return context
+
+async def api_query_vector_db_batch(queries: list, method: str = "char-split", n_results: int = 5):
+    """API版本的批量查询功能: 一次批量嵌入 + 一次多向量 collection.query，结果顺序与queries一致"""
+    try:
+        if len(queries) > QUERY_BATCH_MAX_QUERIES:
+            raise Exception(f"Too many queries: {len(queries)} (max {QUERY_BATCH_MAX_QUERIES} per request)")
+        
+        # 批量查询只做向量检索，与 retrieval="vector" 的 /query 共用缓存
+        cache_kind = _cache_kind("query", "vector")
+        responses = [None] * len(queries)
+        generation = query_cache.generation(method)
+        for i, query in enumerate(queries):
+            cached = query_cache.get_exact(cache_kind, method, n_results, query)
+            if cached is not None:
+                responses[i] = _cached_response(cached, query, "exact")
+        
+        # 未命中的query批量向量化（复用generate_text_embeddings的缓存、分批和限流）
+        pending = [i for i, response in enumerate(responses) if response is None]
+        embeddings = {}
+        if pending:
+            pending_embeddings = await asyncio.to_thread(
+                generate_text_embeddings, [queries[i] for i in pending], EMBEDDING_DIMENSION)
+            embeddings = dict(zip(pending, pending_embeddings))
+        
+        misses = []
+        for i in pending:
+            hit = query_cache.get_semantic(cache_kind, method, n_results, embeddings[i])
+            if hit is not None:
+                responses[i] = _cached_response(hit[0], queries[i], "semantic", hit[1], hit[2])
+            else:
+                misses.append(i)
+        
+        if misses:
+            results = await query_collection(method, [embeddings[i] for i in misses], n_results)
+            for j, i in enumerate(misses):
+                response = _query_response(queries[i], method, "vector", results, row=j)
+                query_cache.put(cache_kind, method, n_results, queries[i], embeddings[i], response, generation)
+                responses[i] = _cached_response(response, queries[i], "miss")
         
         return {
             "status": "success",
-            "query": query,
             "method": method,
-            "results": {
-                "documents": results["documents"][0],
-                "distances": results["distances"][0],
-                "metadatas": results["metadatas"][0],
-                "ids": results["ids"][0]
-            }
+            "count": len(queries),
+            "cache_hits": len(queries) - len(misses),
+            "results": responses
         }
     except Exception as e:
         raise Exception(str(e))
 
-def api_chat_with_llm(query: str, method: str = "char-split", n_results: int = 10):
+async def api_chat_with_llm(query: str, method: str = "char-split", n_results: int = 10, retrieval: str = "vector"):
     """API版本的聊天功能"""
     try:
-        client = chromadb.HttpClient(host=CHROMADB_HOST, port=CHROMADB_PORT)
-        collection_name = f"{method}-collection"
-        
-        try:
-            collection = client.get_collection(name=collection_name)
-        except Exception:
-            raise Exception(f"Collection '{collection_name}' not found. Please run /load first.")
-        
-        query_embedding = generate_query_embedding(query)
-        
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results
-        )
-        
-        # 将查询结果拼接成上下文
-        context_chunks = "\n\n---\n".join(results["documents"][0])
-        
-        # 构建prompt
-        input_prompt = f"""
-        System: {SYSTEM_INSTRUCTION}
+        cache_kind = _cache_kind("chat", retrieval)
+        cached = query_cache.get_exact(cache_kind, method, n_results, query)
+        if cached is not None:
+            return _cached_response(cached, query, "exact")
+        generation = query_cache.generation(method)
         
-        User question:
-        {query}
+        results, query_embedding, hit, retrieval = await retrieve(
+            "chat", query, method, n_results, retrieval, fetch=_rerank_fetch(n_results))
+        if hit is not None:
+            return _cached_response(hit[0], query, "semantic", hit[1], hit[2])
         
-        Context from retrieved text:
-        {context_chunks}
-        """
+        # rerank在工作线程中运行（CPU打分不阻塞事件循环）
+        results, rerank_report = await asyncio.to_thread(rerank_results, query, results, n_results)
+        input_prompt, context_report = build_chat_prompt(query, results)
         
         #将prompt 传给llm 生成回答（我们用的是Gemini 2.0 Flash）
-        response = llm_client.models.generate_content(
-            model=GENERATIVE_MODEL, contents=input_prompt
+        response = await llm_client.aio.models.generate_content(
+            model=GENERATIVE_MODEL, contents=input_prompt, config=CHAT_GENERATION_CONFIG
         )
         
-        return {
+        chat_response = {
             "status": "success",
             "query": query,
             "method": method,
+            "retrieval": retrieval,
             "response": response.text,
-            "context_chunks_count": len(results["documents"][0])
+            "context_chunks_count": len(results["documents"][0]),
+            "context": _chat_context(results),
+            "context_tokens": context_report,
+            "rerank": rerank_report
         }
+        query_cache.put(_cache_kind("chat", retrieval), method, n_results, query, query_embedding, chat_response,
+                        generation)
+        return _cached_response(chat_response, query, "miss")
     except Exception as e:
         raise Exception(str(e))
 
-def api_list_collections():
+async def _generate_text_stream(input_prompt: str):
+    """Gemini流式生成，逐段yield文本"""
+    stream = await llm_client.aio.models.generate_content_stream(
+        model=GENERATIVE_MODEL, contents=input_prompt, config=CHAT_GENERATION_CONFIG
+    )
+    async for chunk in stream:
+        if chunk.text:
+            yield chunk.text
+
+async def api_chat_with_llm_stream(query: str, method: str = "char-split", n_results: int = 10,
+                                   generate_stream=None, retrieval: str = "vector"):
+    """API版本的流式聊天功能，依次yield (event, data)：
+
+    - ("context", ...) 检索到的chunk元数据，在生成开始前发出
+    - ("token", {"text": ...}) 生成的文本片段
+    - ("done", ...) 完整回答的统计；出错时为 ("error", {"detail": ...})
+
+    generate_stream(prompt) 可替换真实的Gemini流式调用（例如测试用的fake generator）。
+    命中 /chat 的响应缓存时直接以一个token事件返回缓存的回答。
+    """
+    start = time.perf_counter()
+    generate_stream = generate_stream or _generate_text_stream
+    try:
+        cache_kind = _cache_kind("chat", retrieval)
+        cached = query_cache.get_exact(cache_kind, method, n_results, query)
+        generation = query_embedding = None
+        if cached is not None:
+            cached = _cached_response(cached, query, "exact")
+        else:
+            generation = query_cache.generation(method)
+            results, query_embedding, hit, retrieval = await retrieve(
+                "chat", query, method, n_results, retrieval, fetch=_rerank_fetch(n_results))
+            if hit is not None:
+                cached = _cached_response(hit[0], query, "semantic", hit[1], hit[2])
+        
+        if cached is not None:
+            yield "context", {
+                "query": query,
+                "method": method,
+                "context_chunks_count": cached["context_chunks_count"],
+                "context": cached.get("context"),
+                "context_tokens": cached.get("context_tokens"),
+                "rerank": cached.get("rerank"),
+                "cache": cached["cache"]
+            }
+            yield "token", {"text": cached["response"]}
+            yield "done", {"response_chars": len(cached["response"]),
+                           "total_seconds": time.perf_counter() - start}
+            return
+        
+        results, rerank_report = await asyncio.to_thread(rerank_results, query, results, n_results)
+        retrieval_seconds = time.perf_counter() - start
+        input_prompt, context_report = build_chat_prompt(query, results)
+        yield "context", {
+            "query": query,
+            "method": method,
+            "retrieval": retrieval,
+            "context_chunks_count": len(results["documents"][0]),
+            "context": _chat_context(results),
+            "context_tokens": context_report,
+            "rerank": rerank_report,
+            "cache": {"level": "miss"},
+            "retrieval_seconds": retrieval_seconds
+        }
+
+        parts = []
+        first_token_seconds = None
+        async for text in generate_stream(input_prompt):
+            if first_token_seconds is None:
+                first_token_seconds = time.perf_counter() - start
+            parts.append(text)
+            yield "token", {"text": text}
+        
+        response_text = "".join(parts)
+        query_cache.put(_cache_kind("chat", retrieval), method, n_results, query, query_embedding, {
+            "status": "success",
+            "query": query,
+            "method": method,
+            "retrieval": retrieval,
+            "response": response_text,
+            "context_chunks_count": len(results["documents"][0]),
+            "context": _chat_context(results),
+            "context_tokens": context_report,
+            "rerank": rerank_report
+        }, generation)
+        yield "done", {
+            "response_chars": len(response_text),
+            "retrieval_seconds": retrieval_seconds,
+            "first_token_seconds": first_token_seconds,
+            "total_seconds": time.perf_counter() - start
+        }
+    except Exception as e:
+        yield "error", {"detail": str(e)}
+
+async def api_list_collections():
     """API版本的列出集合功能"""
     try:
-        client = chromadb.HttpClient(host=CHROMADB_HOST, port=CHROMADB_PORT)
-        collections = client.list_collections()
+        collections = await (await chroma.aclient()).list_collections()
         
         return {
             "status": "success",
             "collections": [{"name": col.name, "id": col.id} for col in collections]
         }
     except Exception as e:
-        raise Exception(str(e))
\ No newline at end of file
+        raise Exception(str(e))
+
+def api_embedding_cache_stats():
+    """API版本的嵌入缓存统计"""
+    return {
+        "status": "success",
+        "model": EMBEDDING_MODEL,
+        "dimensionality": EMBEDDING_DIMENSION,
+        "cache": embedding_cache.stats(),
+        "rate_limiter": embedding_rate_limiter.stats()
+    }
+
+def api_refresh_local_index(method: str):
+    """API版本的进程内索引重建（从当前Chroma集合导出）: BM25索引，以及配置了exact/ivf时的向量索引"""
+    try:
+        collection = chroma.get_collection(f"{method}-collection")
+        local_index = refresh_local_index(method, collection) if retrieval_backend(method) != "chroma" else None
+        lexical_index = refresh_lexical_index(method, collection)
+        query_cache.invalidate(method)
+        return {"status": "success", "method": method, "local_index": local_index, "lexical_index": lexical_index}
+    except Exception as e:
+        raise Exception(str(e))
+
+def api_local_index_stats():
+    """API版本的进程内索引状态"""
+    return {
+        "status": "success",
+        "backends": {m: retrieval_backend(m) for m in ("char-split", "recursive-split", "semantic-split")},
+        "loaded": local_indexes.stats(),
+        "lexical": lexical_indexes.stats()
+    }
+
+async def api_chromadb_health():
+    """API版本的ChromaDB健康检查（经由共享客户端的heartbeat）"""
+    return await chroma.health()
+
+def api_query_cache_stats():
+    """API版本的查询缓存统计"""
+    return {
+        "status": "success",
+        "max_entries": QUERY_CACHE_MAX_ENTRIES,
+        "ttl_seconds": QUERY_CACHE_TTL_SECONDS,
+        "max_distance": QUERY_CACHE_MAX_DISTANCE,
+        "cache": query_cache.stats()
+    }
\ No newline at end of file
@@ -1,88 +1,86 @@
 """Experimental **text splitter** based on semantic similarity."""
 
 import copy
+import functools
+import multiprocessing
 import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from typing import Any, Dict, Iterable, List, Literal, Optional, Sequence, Tuple, cast
 
 import numpy as np
-from langchain_community.utils.math import (
-    cosine_similarity,
-)
 from langchain_core.documents import BaseDocumentTransformer, Document
 # from langchain_core.embeddings import Embeddings
 
 
-def combine_sentences(sentences: List[dict], buffer_size: int = 1) -> List[dict]:
-    """Combine sentences based on buffer size.
-
-    Args:
-        sentences: List of sentences to combine.
-        buffer_size: Number of sentences to combine. Defaults to 1.
+class SentenceWindows(Sequence[str]):
+    """Buffered sentence windows backed by one joined string.
 
-    Returns:
-        List of sentences with combined sentences.
+    Window ``i`` is ``" ".join(sentences[i - buffer_size : i + buffer_size + 1])``
+    (clipped at both ends). Only the joined text and two int64 offset arrays
+    are kept; each window is materialized with a single slice on access, so
+    building the structure is O(n) regardless of ``buffer_size``.
     """
 
-    # Go through each sentence dict
-    for i in range(len(sentences)):
-        # Create a string that will hold the sentences which are joined
-        combined_sentence = ""
-
-        # Add sentences before the current one, based on the buffer size.
-        for j in range(i - buffer_size, i):
-            # Check if the index j is not negative
-            # (to avoid index out of range like on the first one)
-            if j >= 0:
-                # Add the sentence at index j to the combined_sentence string
-                combined_sentence += sentences[j]["sentence"] + " "
+    def __init__(self, sentences: Sequence[str], buffer_size: int = 1):
+        n = len(sentences)
+        self._text = " ".join(sentences)
+        lengths = np.fromiter(map(len, sentences), dtype=np.int64, count=n)
+        starts = np.zeros(n, dtype=np.int64)
+        if n > 1:
+            np.cumsum(lengths[:-1] + 1, out=starts[1:])
+        ends = starts + lengths
+        index = np.arange(n)
+        self._window_starts = starts[np.maximum(index - buffer_size, 0)]
+        self._window_ends = ends[np.minimum(index + buffer_size, n - 1)]
 
-        # Add the current sentence
-        combined_sentence += sentences[i]["sentence"]
+    def __len__(self) -> int:
+        return len(self._window_starts)
 
-        # Add sentences after the current one, based on the buffer size
-        for j in range(i + 1, i + 1 + buffer_size):
-            # Check if the index j is within the range of the sentences list
-            if j < len(sentences):
-                # Add the sentence at index j to the combined_sentence string
-                combined_sentence += " " + sentences[j]["sentence"]
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._text[int(self._window_starts[i]) : int(self._window_ends[i])]
 
-        # Then add the whole thing to your dict
-        # Store the combined sentence in the current sentence dict
-        sentences[i]["combined_sentence"] = combined_sentence
 
-    return sentences
-
-
-def calculate_cosine_distances(sentences: List[dict]) -> Tuple[List[float], List[dict]]:
-    """Calculate cosine distances between sentences.
+def combine_sentences(sentences: Sequence[str], buffer_size: int = 1) -> SentenceWindows:
+    """Combine sentences based on buffer size.
 
     Args:
-        sentences: List of sentences to calculate distances for.
+        sentences: List of sentences to combine.
+        buffer_size: Number of sentences on each side to combine. Defaults to 1.
 
     Returns:
-        Tuple of distances and sentences.
+        Sequence whose item ``i`` is sentence ``i`` joined with up to
+        ``buffer_size`` neighbours on each side.
     """
-    distances = []
-    for i in range(len(sentences) - 1):
-        embedding_current = sentences[i]["combined_sentence_embedding"]
-        embedding_next = sentences[i + 1]["combined_sentence_embedding"]
+    return SentenceWindows(sentences, buffer_size)
 
-        # Calculate cosine similarity
-        similarity = cosine_similarity([embedding_current], [embedding_next])[0][0]
 
-        # Convert to cosine distance
-        distance = 1 - similarity
+def calculate_cosine_distances(embeddings: Sequence[Sequence[float]]) -> np.ndarray:
+    """Calculate cosine distances between adjacent embeddings.
 
-        # Append cosine distance to the list
-        distances.append(distance)
+    All embeddings are stacked into one float32 matrix and normalized once;
+    the adjacent similarities are a single row-wise dot product.
 
-        # Store distance in the dictionary
-        sentences[i]["distance_to_next"] = distance
+    Args:
+        embeddings: Embeddings of the combined sentences, in order.
 
-    # Optionally handle the last sentence
-    # sentences[-1]['distance_to_next'] = None  # or a default value
+    Returns:
+        Array of ``len(embeddings) - 1`` distances, where entry ``i`` is the
+        distance between sentence ``i`` and sentence ``i + 1``.
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim != 2 or matrix.shape[0] < 2:
+        return np.empty(0, dtype=np.float32)
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    # Zero vectors have similarity 0 (distance 1), as in langchain's cosine_similarity
+    norms[norms == 0] = 1.0
+    matrix = matrix / norms
 
-    return distances, sentences
+    similarities = np.einsum("ij,ij->i", matrix[:-1], matrix[1:])
+    return 1.0 - similarities
 
 
 BreakpointThresholdType = Literal[
@@ -117,7 +115,18 @@ class SemanticChunker(BaseDocumentTransformer):
         number_of_chunks: Optional[int] = None,
         sentence_split_regex: str = r"(?<=[.?!])\s+",
         embedding_function = None,
+        embedding_batch_size: int = 50,
+        n_jobs: Optional[int] = None,
+        max_pooled_sentences: int = 20000,
     ):
+        """
+        ``embedding_batch_size`` is passed to ``embedding_function`` as ``batch_size``.
+        ``split_texts``/``create_documents`` pool the sentence windows of many
+        texts (up to ``max_pooled_sentences`` per embedding call) and, when
+        ``n_jobs`` > 1, run sentence splitting and thresholding in a process pool.
+        The pool is started on first use and reused by later calls until
+        ``close()`` (or the end of a ``with`` block).
+        """
         self._add_start_index = add_start_index
         self.buffer_size = buffer_size
         self.breakpoint_threshold_type = breakpoint_threshold_type
@@ -130,6 +139,11 @@ class SemanticChunker(BaseDocumentTransformer):
         else:
             self.breakpoint_threshold_amount = breakpoint_threshold_amount
         self.embedding_function = embedding_function
+        self.embedding_batch_size = embedding_batch_size
+        self.n_jobs = n_jobs
+        self.max_pooled_sentences = max_pooled_sentences
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
 
     def _calculate_breakpoint_threshold(
         self, distances: List[float]
@@ -192,41 +206,32 @@ class SemanticChunker(BaseDocumentTransformer):
 
     def _calculate_sentence_distances(
         self, single_sentences_list: List[str]
-    ) -> Tuple[List[float], List[dict]]:
+    ) -> Tuple[np.ndarray, List[str]]:
         """Split text into multiple components."""
 
-        _sentences = [
-            {"sentence": x, "index": i} for i, x in enumerate(single_sentences_list)
-        ]
-        sentences = combine_sentences(_sentences, self.buffer_size)
-        #print(sentences)
-        # embeddings = self.embeddings.embed_documents(
-        #     [x["combined_sentence"] for x in sentences]
-        # )
-        embeddings = self.embedding_function([x["combined_sentence"] for x in sentences],batch_size=50)
-        for i, sentence in enumerate(sentences):
-            sentence["combined_sentence_embedding"] = embeddings[i]
+        combined_sentences = combine_sentences(single_sentences_list, self.buffer_size)
+        embeddings = self.embedding_function(
+            combined_sentences, batch_size=self.embedding_batch_size
+        )
 
-        return calculate_cosine_distances(sentences)
-
-    def split_text(
-        self,
-        text: str,
-    ) -> List[str]:
-        # Splitting the essay (by default on '.', '?', and '!')
-        single_sentences_list = re.split(self.sentence_split_regex, text)
+        return calculate_cosine_distances(embeddings), single_sentences_list
 
+    def _needs_distances(self, single_sentences_list: List[str]) -> bool:
         # having len(single_sentences_list) == 1 would cause the following
         # np.percentile to fail.
         if len(single_sentences_list) == 1:
-            return single_sentences_list
+            return False
         # similarly, the following np.gradient would fail
         if (
             self.breakpoint_threshold_type == "gradient"
             and len(single_sentences_list) == 2
         ):
-            return single_sentences_list
-        distances, sentences = self._calculate_sentence_distances(single_sentences_list)
+            return False
+        return True
+
+    def _chunks_from_distances(
+        self, sentences: List[str], distances: np.ndarray
+    ) -> List[str]:
         if self.number_of_chunks is not None:
             breakpoint_distance_threshold = self._threshold_from_clusters(distances)
             breakpoint_array = distances
@@ -236,11 +241,9 @@ class SemanticChunker(BaseDocumentTransformer):
                 breakpoint_array,
             ) = self._calculate_breakpoint_threshold(distances)
 
-        indices_above_thresh = [
-            i
-            for i, x in enumerate(breakpoint_array)
-            if x > breakpoint_distance_threshold
-        ]
+        indices_above_thresh = np.flatnonzero(
+            np.asarray(breakpoint_array) > breakpoint_distance_threshold
+        ).tolist()
 
         chunks = []
         start_index = 0
@@ -250,9 +253,9 @@ class SemanticChunker(BaseDocumentTransformer):
             # The end index is the current breakpoint
             end_index = index
 
-            # Slice the sentence_dicts from the current start index to the end index
+            # Slice the sentences from the current start index to the end index
             group = sentences[start_index : end_index + 1]
-            combined_text = " ".join([d["sentence"] for d in group])
+            combined_text = " ".join(group)
             chunks.append(combined_text)
 
             # Update the start index for the next group
@@ -260,19 +263,119 @@ class SemanticChunker(BaseDocumentTransformer):
 
         # The last group, if any sentences remain
         if start_index < len(sentences):
-            combined_text = " ".join([d["sentence"] for d in sentences[start_index:]])
+            combined_text = " ".join(sentences[start_index:])
             chunks.append(combined_text)
         return chunks
 
+    def split_text(
+        self,
+        text: str,
+    ) -> List[str]:
+        # Splitting the essay (by default on '.', '?', and '!')
+        single_sentences_list = re.split(self.sentence_split_regex, text)
+
+        if not self._needs_distances(single_sentences_list):
+            return single_sentences_list
+        distances, sentences = self._calculate_sentence_distances(single_sentences_list)
+        return self._chunks_from_distances(sentences, distances)
+
+    def _worker_view(self) -> "SemanticChunker":
+        """Picklable copy without the embedding function, for pool workers."""
+        view = copy.copy(self)
+        view.embedding_function = None
+        view._pool = None
+        view._pool_lock = None
+        return view
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.n_jobs,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    def close(self) -> None:
+        """Shut down the process pool, if one was started."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def __enter__(self) -> "SemanticChunker":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def split_texts(self, texts: List[str]) -> List[List[str]]:
+        """Split many texts, sharing embedding requests across texts.
+
+        Sentence windows from consecutive texts are pooled into one
+        ``embedding_function`` call of up to ``max_pooled_sentences``
+        windows, then distances and chunks are computed per text. The
+        result is identical to ``[self.split_text(t) for t in texts]``.
+        """
+        map_fn = map
+        if self.n_jobs is not None and self.n_jobs > 1 and len(texts) > 1:
+            map_fn = self._get_pool().map
+        sentence_lists = list(
+            map_fn(functools.partial(re.split, self.sentence_split_regex), texts)
+        )
+        results: List[Optional[List[str]]] = [None] * len(texts)
+        view = self._worker_view()
+
+        pending: List[int] = []
+        pending_windows: List[str] = []
+
+        def flush():
+            if not pending:
+                return
+            embeddings = self.embedding_function(
+                pending_windows, batch_size=self.embedding_batch_size
+            )
+            distance_lists = []
+            offset = 0
+            for i in pending:
+                n = len(sentence_lists[i])
+                distance_lists.append(
+                    calculate_cosine_distances(embeddings[offset : offset + n])
+                )
+                offset += n
+            chunk_lists = map_fn(
+                view._chunks_from_distances,
+                [sentence_lists[i] for i in pending],
+                distance_lists,
+            )
+            for i, chunks in zip(pending, chunk_lists):
+                results[i] = chunks
+            pending.clear()
+            pending_windows.clear()
+
+        for i, sentences in enumerate(sentence_lists):
+            if not self._needs_distances(sentences):
+                results[i] = sentences
+                continue
+            if (
+                pending
+                and len(pending_windows) + len(sentences) > self.max_pooled_sentences
+            ):
+                flush()
+            pending.append(i)
+            pending_windows.extend(combine_sentences(sentences, self.buffer_size))
+        flush()
+        return cast(List[List[str]], results)
+
     def create_documents(
         self, texts: List[str], metadatas: Optional[List[dict]] = None
     ) -> List[Document]:
         """Create documents from a list of texts."""
         _metadatas = metadatas or [{}] * len(texts)
         documents = []
-        for i, text in enumerate(texts):
+        for i, chunks in enumerate(self.split_texts(texts)):
             start_index = 0
-            for chunk in self.split_text(text):
+            for chunk in chunks:
                 metadata = copy.deepcopy(_metadatas[i])
                 if self._add_start_index:
                     metadata["start_index"] = start_index
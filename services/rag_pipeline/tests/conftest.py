@@ -0,0 +1,17 @@
+import os
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def rag():
+    """Import the app with the GCP clients mocked out and the caches off."""
+    env = {"GCP_PROJECT": "test", "EMBEDDING_CACHE_PATH": "", "QUERY_CACHE_MAX_ENTRIES": "0",
+           "RETRIEVAL_BACKENDS": ""}
+    with mock.patch.dict(os.environ, env), mock.patch("google.cloud.storage.Client"), \
+            mock.patch("google.genai.Client"):
+        import app as rag_app
+        import rag_core
+    return SimpleNamespace(app=rag_app.app, core=rag_core)
@@ -0,0 +1,87 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+class FakeCollection:
+    async def query(self, query_embeddings, n_results=10, **kwargs):
+        return {
+            "ids": [[f"chunk{i}-0" for i in range(n_results)]],
+            "documents": [[f"Chunk {i} about squats and progressive overload." for i in range(n_results)]],
+            "metadatas": [[{"source": f"source-{i}"} for i in range(n_results)]],
+            "distances": [[0.1 + 0.01 * i for i in range(n_results)]],
+        }
+
+
+class FakeChroma:
+    async def awith_collection(self, name, fn):
+        return await fn(FakeCollection())
+
+
+class FakeModels:
+    """Stands in for ``llm_client.aio.models``; the stream raises after ``fail_after`` chunks if set."""
+
+    def __init__(self, chunks, fail_after=None):
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.prompts = []
+
+    async def embed_content(self, model, contents, config=None):
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=[0.1] * 256)])
+
+    async def generate_content_stream(self, model, contents, config=None):
+        self.prompts.append(contents)
+
+        async def stream():
+            for i, text in enumerate(self.chunks):
+                if i == self.fail_after:
+                    raise RuntimeError("generation interrupted")
+                yield SimpleNamespace(text=text)
+        return stream()
+
+
+@pytest.fixture
+def client(rag, monkeypatch):
+    def make(models: FakeModels) -> TestClient:
+        monkeypatch.setattr(rag.core, "llm_client", SimpleNamespace(aio=SimpleNamespace(models=models)))
+        monkeypatch.setattr(rag.core, "chroma", FakeChroma())
+        return TestClient(rag.app)
+    return make
+
+
+def parse_events(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_chat_stream_sends_context_then_tokens_then_done(client):
+    models = FakeModels(["Squat ", "three times ", "a week."])
+
+    response = client(models).post("/chat/stream", json={"query": "how often should I squat", "n_results": 3})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(response.text)
+    assert [event for event, _ in events] == ["context", "token", "token", "token", "done"]
+    context = events[0][1]
+    assert context["context_chunks_count"] == 3
+    assert context["cache"] == {"level": "miss"}
+    assert "".join(data["text"] for event, data in events if event == "token") == "Squat three times a week."
+    assert events[-1][1]["response_chars"] == len("Squat three times a week.")
+    assert "Chunk 0 about squats" in models.prompts[0]
+
+
+def test_chat_stream_reports_generation_error(client):
+    models = FakeModels(["Squat ", "three times ", "a week."], fail_after=2)
+
+    response = client(models).post("/chat/stream", json={"query": "how often should I deadlift", "n_results": 3})
+
+    assert response.status_code == 200
+    events = parse_events(response.text)
+    assert [event for event, _ in events] == ["context", "token", "token", "error"]
+    assert events[-1][1] == {"detail": "generation interrupted"}
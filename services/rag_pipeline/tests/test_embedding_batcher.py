@@ -0,0 +1,112 @@
+import hashlib
+import random
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+import pytest
+from google.genai import errors
+
+from embedding_batcher import AdaptiveRateLimiter
+from embedding_cache import EmbeddingCache
+
+
+def _vector(text: str, dimensionality: int) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], "little")
+    return np.random.default_rng(seed).standard_normal(dimensionality).astype(np.float32).tolist()
+
+
+def _throttled() -> errors.APIError:
+    return errors.APIError(
+        429, {"error": {"code": 429, "message": "Resource exhausted", "status": "RESOURCE_EXHAUSTED"}})
+
+
+class FakeEmbedder:
+    """
+    ``embed_fn(batch, dimensionality)`` stand-in: sleeps a random few ms and
+    answers 429 for the first ``fail_attempts`` requests of every batch whose
+    first text is in ``throttle``.
+    """
+
+    def __init__(self, throttle=(), fail_attempts: int = 1):
+        self.throttle = set(throttle)
+        self.fail_attempts = fail_attempts
+        self.attempts = Counter()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, batch, dimensionality):
+        with self._lock:
+            self.attempts[batch[0]] += 1
+            attempt = self.attempts[batch[0]]
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            time.sleep(random.uniform(0, 0.005))
+            if batch[0] in self.throttle and attempt <= self.fail_attempts:
+                raise _throttled()
+            return [_vector(text, dimensionality) for text in batch]
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture
+def core(rag, monkeypatch):
+    """rag_core with a fresh in-memory embedding cache and a fast limiter that does not recover."""
+    monkeypatch.setattr(rag.core, "embedding_cache", EmbeddingCache(None))
+    limiter = AdaptiveRateLimiter(rate=1000, increase_step=0, cooldown=0)
+    monkeypatch.setattr(rag.core, "embedding_rate_limiter", limiter)
+    return rag.core
+
+
+def test_concurrent_batches_keep_input_order(core):
+    chunks = [f"chunk {i}" for i in range(120)] + ["chunk 3", "chunk 77"]  # repeated texts are embedded once
+    embedder = FakeEmbedder()
+
+    embeddings = core.generate_text_embeddings(chunks, 16, batch_size=7, embed_fn=embedder, concurrency=8,
+                                               retry_delay=0)
+
+    assert len(embeddings) == len(chunks)
+    np.testing.assert_allclose(embeddings, [_vector(text, 16) for text in chunks], rtol=1e-6)
+    assert embedder.peak_in_flight > 1
+    assert sum(embedder.attempts.values()) == 18  # 120 distinct texts in batches of 7
+
+
+def test_throttled_batches_are_retried_and_lower_the_rate(core):
+    chunks = [f"chunk {i}" for i in range(100)]
+    embedder = FakeEmbedder(throttle={"chunk 0", "chunk 30", "chunk 60"})
+
+    embeddings = core.generate_text_embeddings(chunks, 16, batch_size=10, embed_fn=embedder, concurrency=4,
+                                               retry_delay=0, as_array=True)
+
+    assert embeddings.dtype == np.float32 and embeddings.shape == (100, 16)
+    np.testing.assert_allclose(embeddings, [_vector(text, 16) for text in chunks], rtol=1e-6)
+    assert [embedder.attempts[f"chunk {i}"] for i in range(0, 100, 10)] == [2, 1, 1, 2, 1, 1, 2, 1, 1, 1]
+    stats = core.embedding_rate_limiter.stats()
+    assert stats["throttled"] == 3
+    assert stats["rate_decreases"] >= 1
+    assert stats["rate"] < stats["max_rate"]
+
+
+def test_batch_that_keeps_failing_raises_after_max_retries(core):
+    chunks = [f"chunk {i}" for i in range(40)]
+    embedder = FakeEmbedder(throttle={"chunk 20"}, fail_attempts=100)
+
+    with pytest.raises(Exception, match="after 2 attempts"):
+        core.generate_text_embeddings(chunks, 16, batch_size=10, max_retries=2, embed_fn=embedder, concurrency=4,
+                                      retry_delay=0)
+    assert embedder.attempts["chunk 20"] == 3
+
+
+def test_embeddings_are_served_from_the_cache_the_second_time(core):
+    chunks = [f"chunk {i}" for i in range(30)]
+    core.generate_text_embeddings(chunks, 16, batch_size=10, embed_fn=FakeEmbedder(), retry_delay=0)
+    embedder = FakeEmbedder()
+
+    embeddings = core.generate_text_embeddings(chunks, 16, batch_size=10, embed_fn=embedder, retry_delay=0)
+
+    np.testing.assert_allclose(embeddings, [_vector(text, 16) for text in chunks], rtol=1e-6)
+    assert not embedder.attempts
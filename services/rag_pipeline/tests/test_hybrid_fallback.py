@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from lexical_index import BM25Index
+from query_cache import QueryResultCache
+from vector_index import LocalIndexStore
+
+
+class FakeCollection:
+    async def query(self, query_embeddings, n_results=10, **kwargs):
+        return {
+            "ids": [[f"chunk{i}-0" for i in range(n_results)]],
+            "documents": [[f"Chunk {i} about squat depth." for i in range(n_results)]],
+            "metadatas": [[{"source": f"source-{i}"} for i in range(n_results)]],
+            "distances": [[0.1 * i for i in range(n_results)]],
+        }
+
+
+class FakeChroma:
+    async def awith_collection(self, name, fn):
+        return await fn(FakeCollection())
+
+
+class FakeAsyncModels:
+    async def embed_content(self, model, contents, config=None):
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=[0.1] * 256)])
+
+
+@pytest.fixture
+def client(rag, monkeypatch, tmp_path):
+    lexical_indexes = LocalIndexStore(str(tmp_path), index_types={"bm25": BM25Index})
+    monkeypatch.setattr(rag.core, "lexical_indexes", lexical_indexes)
+    monkeypatch.setattr(rag.core, "llm_client", SimpleNamespace(aio=SimpleNamespace(models=FakeAsyncModels())))
+    monkeypatch.setattr(rag.core, "chroma", FakeChroma())
+    monkeypatch.setattr(rag.core, "query_cache", QueryResultCache(max_entries=100))
+    return SimpleNamespace(http=TestClient(rag.app), lexical_indexes=lexical_indexes)
+
+
+def test_hybrid_without_a_lexical_index_falls_back_to_vector(client):
+    response = client.http.post("/query", json={"query": "squat depth", "n_results": 3, "retrieval": "hybrid"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["retrieval"] == "vector"
+    assert body["results"]["ids"] == ["chunk0-0", "chunk1-0", "chunk2-0"]
+    assert "lexical_ranks" not in body["results"]
+
+
+def test_lexical_without_a_lexical_index_is_an_error(client):
+    response = client.http.post("/query", json={"query": "squat depth", "n_results": 3, "retrieval": "lexical"})
+
+    assert response.status_code == 500
+    assert "No lexical index" in response.json()["detail"]
+
+
+def test_hybrid_uses_the_lexical_index_once_it_exists(client):
+    client.http.post("/query", json={"query": "squat depth", "n_results": 3, "retrieval": "hybrid"})
+    index = BM25Index.build(["chunk9-0", "chunk1-0"], ["deadlift lockout", "squat depth cues"], [{}, {}])
+    client.lexical_indexes.publish("char-split", index)
+
+    body = client.http.post("/query", json={"query": "squat depth", "n_results": 3, "retrieval": "hybrid"}).json()
+
+    assert body["retrieval"] == "hybrid"
+    assert body["cache"] == {"level": "miss"}
+    assert body["results"]["ids"][0] == "chunk1-0"
+    assert "lexical_ranks" in body["results"]
@@ -0,0 +1,116 @@
+import re
+import threading
+import time
+
+import pytest
+
+from ingest_pipeline import IngestPipeline, Stage
+
+
+class FakeEmbedder:
+    """Embed stage stand-in: sleeps ``latency`` per batch and raises on the batches in ``fail_on``."""
+
+    def __init__(self, latency: float = 0.005, fail_on=()):
+        self.latency = latency
+        self.fail_on = set(fail_on)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, batch):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        if batch in self.fail_on:
+            raise RuntimeError(f"embedding request failed for batch {batch}")
+        return batch, [0.0] * 8
+
+
+class Feed:
+    """Items fed to the pipeline; tracks how many were pulled and the peak held in flight."""
+
+    def __init__(self, n: int):
+        self.n = n
+        self.pulled = 0
+        self.completed = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        for i in range(self.n):
+            with self._lock:
+                self.pulled += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.pulled - self.completed)
+            yield i
+
+    def upsert(self, item):
+        with self._lock:
+            self.completed += 1
+        return None
+
+
+def run_with_timeout(pipeline: IngestPipeline, items, timeout: float = 10.0) -> dict:
+    outcome = {}
+
+    def target():
+        try:
+            outcome["stats"] = pipeline.run(items)
+        except BaseException as e:  # noqa: BLE001 - checked by the test
+            outcome["error"] = e
+
+    runner = threading.Thread(target=target, daemon=True)
+    runner.start()
+    runner.join(timeout)
+    assert not runner.is_alive(), "pipeline.run did not return"
+    assert not [t for t in threading.enumerate() if t.name.startswith("ingest-")], "worker threads left running"
+    return outcome
+
+
+def make_pipeline(embedder: FakeEmbedder, feed: Feed, queue_size: int = 2) -> IngestPipeline:
+    return IngestPipeline([
+        Stage("split", lambda i: i, workers=2),
+        Stage("embed", embedder, workers=2),
+        Stage("upsert", feed.upsert, workers=1),
+    ], queue_size=queue_size)
+
+
+def test_slow_embedder_applies_backpressure_and_drains():
+    feed = Feed(200)
+    embedder = FakeEmbedder(latency=0.002)
+
+    outcome = run_with_timeout(make_pipeline(embedder, feed), feed)
+
+    assert "error" not in outcome
+    assert feed.pulled == feed.completed == embedder.calls == 200
+    # queues (3 x 2) + workers (5) + the item the producer is blocked on
+    assert feed.peak_in_flight <= 3 * 2 + 5 + 1
+    stages = outcome["stats"]["stages"]
+    assert stages["embed"]["items_in"] == stages["embed"]["items_out"] == 200
+    assert stages["upsert"]["items_out"] == 0
+
+
+def test_embedder_error_stops_the_feed_and_is_raised():
+    feed = Feed(10_000)
+    embedder = FakeEmbedder(fail_on={20, 21})
+
+    outcome = run_with_timeout(make_pipeline(embedder, feed), feed)
+
+    assert isinstance(outcome.get("error"), RuntimeError)
+    assert re.search(r"failed for batch 2[01]$", str(outcome["error"]))
+    assert feed.pulled < 100  # the producer stopped soon after the failure
+    assert feed.completed < feed.pulled
+    assert embedder.calls < feed.pulled  # remaining items were drained without being embedded
+
+
+def test_error_in_the_feed_is_raised():
+    def items():
+        yield from range(5)
+        raise ValueError("listing failed")
+
+    outcome = run_with_timeout(make_pipeline(FakeEmbedder(), Feed(0)), items())
+
+    assert isinstance(outcome.get("error"), ValueError)
+
+
+def test_stage_needs_a_worker():
+    with pytest.raises(ValueError):
+        Stage("embed", lambda item: item, workers=0)
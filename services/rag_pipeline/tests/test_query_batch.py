@@ -0,0 +1,86 @@
+import hashlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from embedding_cache import EmbeddingCache
+from query_cache import QueryResultCache
+
+
+def _vector(text: str) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], "little")
+    return np.random.default_rng(seed).standard_normal(256).astype(np.float32).tolist()
+
+
+class FakeCollection:
+    """One result row per query embedding; the documents name the query's first coordinate."""
+
+    async def query(self, query_embeddings, n_results=10, **kwargs):
+        rows = range(len(query_embeddings))
+        return {
+            "ids": [[f"chunk{row}-{i}" for i in range(n_results)] for row in rows],
+            "documents": [[f"{query_embeddings[row][0]:.6f} #{i}" for i in range(n_results)] for row in rows],
+            "metadatas": [[{"source": f"source-{i}"} for i in range(n_results)] for _ in rows],
+            "distances": [[0.1 * i for i in range(n_results)] for _ in rows],
+            "embeddings": None,
+            "included": ["documents", "metadatas", "distances"],
+        }
+
+
+class FakeChroma:
+    async def awith_collection(self, name, fn):
+        return await fn(FakeCollection())
+
+
+class FakeModels:
+    def embed_content(self, model, contents, config=None):
+        texts = [contents] if isinstance(contents, str) else contents
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=_vector(t)) for t in texts])
+
+
+class FakeAsyncModels(FakeModels):
+    async def embed_content(self, model, contents, config=None):
+        return FakeModels.embed_content(self, model, contents, config)
+
+
+@pytest.fixture
+def client(rag, monkeypatch):
+    monkeypatch.setattr(rag.core, "llm_client", SimpleNamespace(
+        models=FakeModels(), aio=SimpleNamespace(models=FakeAsyncModels())))
+    monkeypatch.setattr(rag.core, "chroma", FakeChroma())
+    monkeypatch.setattr(rag.core, "embedding_cache", EmbeddingCache(None))
+    monkeypatch.setattr(rag.core, "query_cache", QueryResultCache(max_entries=100))
+    return TestClient(rag.app)
+
+
+def _without_cache(response: dict) -> dict:
+    return {key: value for key, value in response.items() if key != "cache"}
+
+
+def test_batch_results_are_the_query_results_in_order(client):
+    queries = ["squat depth", "deadlift grip", "bench arch"]
+
+    batch = client.post("/query/batch", json={"queries": queries, "n_results": 3}).json()
+
+    assert [item["query"] for item in batch["results"]] == queries
+    for query, item in zip(queries, batch["results"]):
+        assert item["cache"] == {"level": "miss"}
+        assert item["results"]["documents"][0] == f"{_vector(query)[0]:.6f} #0"
+
+
+def test_batch_and_query_cache_the_same_response(client):
+    batch = client.post("/query/batch", json={"queries": ["squat depth"], "n_results": 3}).json()["results"][0]
+    query = client.post("/query", json={"query": "squat depth", "n_results": 3}).json()
+
+    assert query["cache"] == {"level": "exact"}
+    assert _without_cache(query) == _without_cache(batch)
+    assert query["retrieval"] == "vector"
+    assert set(query["results"]) == {"ids", "documents", "metadatas", "distances"}
+
+    fresh = client.post("/query", json={"query": "bench arch", "n_results": 3}).json()
+    from_batch = client.post("/query/batch", json={"queries": ["bench arch"], "n_results": 3}).json()["results"][0]
+
+    assert from_batch["cache"] == {"level": "exact"}
+    assert _without_cache(from_batch) == _without_cache(fresh)
@@ -0,0 +1,38 @@
+import numpy as np
+
+from rerank import prepare_term_overlap, rerank, term_overlap_scores
+
+QUERY = "romanian deadlift hamstring tempo"
+DOCUMENTS = [
+    "Romanian deadlift: hinge at the hips and keep the bar close.",
+    "Bench press tempo for hypertrophy.",
+    "Hamstring curls and Romanian deadlift variations train the hamstring.",
+    "Protein intake of 1.6 g per kg supports recovery.",
+    "Tempo squats build control out of the hole.",
+    "Deadlift lockout and hamstring tension with a slow tempo.",
+    "Sleep and recovery between sessions.",
+    "Romanian deadlift tempo: three seconds down, hamstring stretch at the bottom.",
+]
+
+
+def test_batch_scores_use_statistics_of_all_candidates():
+    batch_scorer = prepare_term_overlap(QUERY, DOCUMENTS)
+    batched = np.concatenate([batch_scorer(QUERY, DOCUMENTS[i:i + 3]) for i in range(0, len(DOCUMENTS), 3)])
+
+    np.testing.assert_allclose(batched, term_overlap_scores(QUERY, DOCUMENTS), rtol=1e-6)
+
+
+def test_rerank_order_does_not_depend_on_the_batch_size():
+    whole, _ = rerank(QUERY, DOCUMENTS, 4, term_overlap_scores, time_budget_ms=1e6, batch_size=len(DOCUMENTS))
+    batched, report = rerank(QUERY, DOCUMENTS, 4, term_overlap_scores, time_budget_ms=1e6, batch_size=2)
+
+    assert batched == whole
+    assert report["scored"] == len(DOCUMENTS) and not report["budget_exhausted"]
+
+
+def test_rerank_is_off_by_default(rag):
+    results = {"ids": [["a", "b", "c"]], "documents": [DOCUMENTS[:3]], "metadatas": [[{}, {}, {}]],
+               "distances": [[0.1, 0.2, 0.3]]}
+
+    assert rag.core._rerank_fetch(10) == 10
+    assert rag.core.rerank_results(QUERY, results, 3) == (results, None)
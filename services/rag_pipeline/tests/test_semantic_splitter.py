@@ -0,0 +1,36 @@
+import numpy as np
+
+from semantic_splitter import SemanticChunker
+
+TOPICS = ["Squats build the legs.", "Protein helps recovery.", "Sleep restores energy."]
+
+
+def fake_embeddings(texts, batch_size=None):
+    """Windows about the same topic get the same vector."""
+    vectors = []
+    for text in texts:
+        vector = np.zeros(len(TOPICS))
+        for i, topic in enumerate(TOPICS):
+            vector[i] = text.count(topic.split()[0])
+        vectors.append(vector + 0.01)
+    return vectors
+
+
+def make_texts(n):
+    """Runs of sentences on one topic, then the next."""
+    return [" ".join(TOPICS[(i + j // 4) % 3] for j in range(12)) for i in range(n)]
+
+
+def test_split_texts_reuses_one_pool_until_close():
+    texts = make_texts(6)
+    chunker = SemanticChunker(embedding_function=fake_embeddings, n_jobs=2)
+    expected = [chunker.split_text(text) for text in texts]
+    assert any(len(chunks) > 1 for chunks in expected)
+
+    with chunker:
+        assert chunker.split_texts(texts) == expected
+        pool = chunker._pool
+        assert pool is not None
+        assert chunker.split_texts(texts[:3]) == expected[:3]
+        assert chunker._pool is pool
+    assert chunker._pool is None
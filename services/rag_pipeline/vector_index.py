@@ -0,0 +1,349 @@
+"""In-process vector indexes served from memory-mapped snapshots.
+
+* ``ExactIndex``: brute-force top-k over one contiguous, L2-normalized
+  float32 matrix; the right choice up to a few tens of thousands of vectors.
+* ``IVFIndex``: inverted file index. Spherical k-means centroids partition
+  the vectors, rows are stored grouped by list, and a query scores only the
+  ``nprobe`` closest lists.
+
+Distances are cosine distances (1 - cosine similarity), the same as the
+``hnsw:space=cosine`` Chroma collections, so results are interchangeable.
+
+Both indexes can store the scanned matrix as int8 (``dtype="int8"``):
+symmetric scalar quantization with one float32 scale per vector, a quarter
+of the float32 size. Rows are dequantized block by block while scoring, and
+the best ``k * rescore`` candidates are re-scored against a float32 copy
+(``full.npy``) that stays on disk and is only paged in for those rows.
+
+``LocalIndexStore`` keeps one snapshot directory per method::
+
+    {root}/{method}/{version}/index.json, vectors.npy, records.json
+                               [, scales.npy, full.npy, centroids.npy, offsets.npy]
+    {root}/{method}/CURRENT            -> name of the live version
+
+A new snapshot is written to a fresh version directory and then published
+by atomically replacing CURRENT, so readers (in this or other processes)
+never see a half-written index. Vectors are opened with ``mmap_mode="r"``,
+so a cold start maps the file instead of reading it.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DTYPES = ("float32", "int8")
+# rows dequantized per matmul; keeps the float32 temporary cache-sized
+_SCORE_BLOCK_ROWS = 1024
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-vector int8 quantization: ``vectors ~= codes * scales[:, None]``."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class ExactIndex:
+    kind = "exact"
+
+    def __init__(self, vectors: np.ndarray, ids: List[str], documents: List[str], metadatas: List[dict],
+                 scales: np.ndarray = None, full: np.ndarray = None, rescore: int = 4):
+        self.vectors = vectors  # normalized float32 rows, or int8 codes when scales is set
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.scales = scales
+        self.full = full  # normalized float32 rows for re-scoring quantized candidates
+        self.rescore = rescore
+
+    @classmethod
+    def _prepare(cls, embeddings, dtype: str, rescore: int):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported index dtype '{dtype}', expected one of {DTYPES}")
+        vectors = _normalize(embeddings)
+        if dtype == "float32":
+            return vectors, None, None
+        codes, scales = quantize_int8(vectors)
+        return codes, scales, (vectors if rescore > 0 else None)
+
+    @classmethod
+    def build(cls, embeddings, ids, documents, metadatas, dtype: str = "float32", rescore: int = 4,
+              **kwargs) -> "ExactIndex":
+        vectors, scales, full = cls._prepare(embeddings, dtype, rescore)
+        return cls(vectors, list(ids), list(documents), list(metadatas), scales, full, rescore)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dtype(self) -> str:
+        return "int8" if self.scales is not None else "float32"
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of the scanned data (the part that has to stay resident)."""
+        return int(self.vectors.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    def describe(self) -> dict:
+        return {"kind": self.kind, "dtype": self.dtype, "vectors": len(self), "bytes": self.nbytes,
+                "rescore": self.full is not None}
+
+    def _scores(self, start: int, end: int, queries: np.ndarray) -> np.ndarray:
+        """(end - start, len(queries)) similarity of rows [start, end) with normalized queries."""
+        if self.scales is None:
+            return self.vectors[start:end] @ queries.T
+        scores = np.empty((end - start, queries.shape[0]), dtype=np.float32)
+        for a in range(start, end, _SCORE_BLOCK_ROWS):
+            b = min(a + _SCORE_BLOCK_ROWS, end)
+            scores[a - start:b - start] = self.vectors[a:b].astype(np.float32) @ queries.T
+        scores *= self.scales[start:end, None]
+        return scores
+
+    def _select(self, query: np.ndarray, rows: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top k of the scored rows; quantized scores are re-scored at full precision first."""
+        if self.full is None or self.rescore <= 0:
+            top = _top_k(scores, k)
+            return rows[top], 1.0 - scores[top]
+        candidates = rows[_top_k(scores, k * self.rescore)]
+        candidates.sort()  # sequential reads from the memory-mapped full.npy
+        exact = self.full[candidates] @ query
+        top = _top_k(exact, k)
+        return candidates[top], 1.0 - exact[top]
+
+    def search(self, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Per query: (row indices, cosine distances), nearest first."""
+        queries = _normalize(queries)
+        scores = self._scores(0, len(self), queries)
+        rows = np.arange(len(self))
+        return [self._select(query, rows, scores[:, i], k) for i, query in enumerate(queries)]
+
+    # ---- persistence ----
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "vectors.npy"), np.ascontiguousarray(self.vectors))
+        if self.scales is not None:
+            np.save(os.path.join(directory, "scales.npy"), self.scales)
+        if self.full is not None:
+            np.save(os.path.join(directory, "full.npy"), np.ascontiguousarray(self.full))
+        with open(os.path.join(directory, "records.json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "documents": self.documents, "metadatas": self.metadatas}, f)
+        with open(os.path.join(directory, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({"kind": self.kind, "dtype": self.dtype, "vectors": len(self),
+                       "dim": int(self.vectors.shape[1])}, f)
+
+    @classmethod
+    def _load_parts(cls, directory: str) -> Tuple[np.ndarray, dict, Optional[np.ndarray], Optional[np.ndarray]]:
+        def optional(name):
+            path = os.path.join(directory, name)
+            return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "records.json"), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        return vectors, records, optional("scales.npy"), optional("full.npy")
+
+    @classmethod
+    def load(cls, directory: str, rescore: int = 4, **kwargs) -> "ExactIndex":
+        vectors, records, scales, full = cls._load_parts(directory)
+        return cls(vectors, records["ids"], records["documents"], records["metadatas"], scales, full, rescore)
+
+
+class IVFIndex(ExactIndex):
+    kind = "ivf"
+
+    def __init__(self, vectors, ids, documents, metadatas, centroids: np.ndarray, offsets: np.ndarray,
+                 nprobe: int = 8, scales: np.ndarray = None, full: np.ndarray = None, rescore: int = 4):
+        super().__init__(vectors, ids, documents, metadatas, scales, full, rescore)
+        self.centroids = centroids
+        self.offsets = offsets  # rows of list i are vectors[offsets[i]:offsets[i + 1]]
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, embeddings, ids, documents, metadatas, nlist: int = None, nprobe: int = 8,
+              iterations: int = 10, sample_size: int = 20000, seed: int = 0, dtype: str = "float32",
+              rescore: int = 4, **kwargs) -> "IVFIndex":
+        vectors = _normalize(embeddings)
+        n = vectors.shape[0]
+        nlist = max(1, min(n, nlist or int(np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+
+        # spherical k-means on a sample
+        sample = vectors[rng.choice(n, size=min(n, sample_size), replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=nlist) == 0
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+
+        # group all rows by list
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignment, minlength=nlist))
+        stored, scales, full = cls._prepare(vectors[order], dtype, rescore)
+        return cls(
+            stored,
+            [ids[i] for i in order],
+            [documents[i] for i in order],
+            [metadatas[i] for i in order],
+            centroids, offsets, nprobe, scales, full, rescore,
+        )
+
+    def search(self, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        queries = _normalize(queries)
+        list_scores = queries @ self.centroids.T
+        nprobe = min(self.nprobe, self.centroids.shape[0])
+        results = []
+        for query, scores in zip(queries, list_scores):
+            probes = _top_k(scores, nprobe)
+            # lists are contiguous row ranges: score them in place, no gather copy
+            starts, ends = self.offsets[probes], self.offsets[probes + 1]
+            candidate_scores = np.concatenate([self._scores(a, b, query[None])[:, 0] for a, b in zip(starts, ends)])
+            rows = np.concatenate([np.arange(a, b) for a, b in zip(starts, ends)])
+            results.append(self._select(query, rows, candidate_scores, k))
+        return results
+
+    def save(self, directory: str):
+        super().save(directory)
+        np.save(os.path.join(directory, "centroids.npy"), self.centroids)
+        np.save(os.path.join(directory, "offsets.npy"), self.offsets)
+
+    @classmethod
+    def load(cls, directory: str, nprobe: int = 8, rescore: int = 4, **kwargs) -> "IVFIndex":
+        vectors, records, scales, full = cls._load_parts(directory)
+        return cls(
+            vectors, records["ids"], records["documents"], records["metadatas"],
+            np.load(os.path.join(directory, "centroids.npy")),
+            np.load(os.path.join(directory, "offsets.npy")),
+            nprobe, scales, full, rescore,
+        )
+
+
+INDEX_TYPES = {cls.kind: cls for cls in (ExactIndex, IVFIndex)}
+
+
+def recall_at_k(index: ExactIndex, embeddings: np.ndarray, ids: Sequence[str], queries: np.ndarray,
+                k: int = 10) -> float:
+    """Fraction of the exact float32 top-k over ``embeddings`` that ``index`` also returns (matched by id)."""
+    baseline = ExactIndex.build(embeddings, ids, [""] * len(ids), [{}] * len(ids))
+    found = 0
+    for (expected, _), (rows, _) in zip(baseline.search(queries, k), index.search(queries, k)):
+        found += len({baseline.ids[i] for i in expected} & {index.ids[i] for i in rows})
+    return found / (len(queries) * min(k, len(ids)))
+
+
+class LocalIndexStore:
+    """Versioned snapshots per method, published atomically and loaded lazily."""
+
+    def __init__(self, root: str, nprobe: int = 8, rescore: int = 4, check_interval: float = 5.0,
+                 keep_versions: int = 2, index_types: Dict[str, type] = None):
+        self.root = root
+        self.index_types = index_types or INDEX_TYPES
+        self.nprobe = nprobe
+        self.rescore = rescore
+        self.check_interval = check_interval
+        self.keep_versions = keep_versions
+        self._indexes: Dict[str, Tuple[str, ExactIndex]] = {}  # method -> (version, index)
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _current_path(self, method: str) -> str:
+        return os.path.join(self.root, method, "CURRENT")
+
+    def _current_version(self, method: str) -> Optional[str]:
+        try:
+            with open(self._current_path(method), "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def publish(self, method: str, index: ExactIndex) -> str:
+        """Write a new snapshot, make it current and serve it from now on."""
+        version = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+        method_dir = os.path.join(self.root, method)
+        index.save(os.path.join(method_dir, version))
+        tmp_path = self._current_path(method) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(tmp_path, self._current_path(method))
+
+        loaded = type(index).load(os.path.join(method_dir, version), nprobe=self.nprobe,
+                                  rescore=self.rescore)
+        with self._lock:
+            self._indexes[method] = (version, loaded)
+            self._checked_at[method] = time.monotonic()
+        self._remove_old_versions(method, version)
+        return version
+
+    def _remove_old_versions(self, method: str, current: str):
+        method_dir = os.path.join(self.root, method)
+        versions = sorted(d for d in os.listdir(method_dir)
+                          if d != current and os.path.isdir(os.path.join(method_dir, d)))
+        # mapped files of removed versions stay readable until unmapped
+        for version in versions[:max(0, len(versions) - (self.keep_versions - 1))]:
+            shutil.rmtree(os.path.join(method_dir, version), ignore_errors=True)
+
+    def get(self, method: str) -> Optional[ExactIndex]:
+        """The current index of ``method`` (None without a snapshot); picks up newer snapshots."""
+        now = time.monotonic()
+        with self._lock:
+            loaded = self._indexes.get(method)
+            if loaded is not None and now - self._checked_at.get(method, 0) < self.check_interval:
+                return loaded[1]
+            self._checked_at[method] = now
+        version = self._current_version(method)
+        if version is None:
+            return None
+        if loaded is not None and loaded[0] == version:
+            return loaded[1]
+        directory = os.path.join(self.root, method, version)
+        with open(os.path.join(directory, "index.json"), "r", encoding="utf-8") as f:
+            kind = json.load(f)["kind"]
+        index = self.index_types[kind].load(directory, nprobe=self.nprobe, rescore=self.rescore)
+        with self._lock:
+            self._indexes[method] = (version, index)
+        return index
+
+    def search(self, method: str, query_embeddings: Sequence[Sequence[float]], n_results: int) -> Optional[dict]:
+        """Chroma-shaped query result, or None if ``method`` has no snapshot."""
+        index = self.get(method)
+        if index is None:
+            return None
+        results = index.search(np.asarray(query_embeddings, dtype=np.float32), n_results)
+        return {
+            "ids": [[index.ids[i] for i in rows] for rows, _ in results],
+            "documents": [[index.documents[i] for i in rows] for rows, _ in results],
+            "metadatas": [[index.metadatas[i] for i in rows] for rows, _ in results],
+            "distances": [distances.tolist() for _, distances in results],
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {method: {"version": version, **index.describe()}
+                    for method, (version, index) in self._indexes.items()}